@@ -0,0 +1,226 @@
+# FILE: analytics.py
+# Agregasi laporan analitik langsung di SQL (GROUP BY + conditional sum).
+# Yang keluar dari database hanya ringkasan per (poli, dokter, jam check-in).
+# Laporan dibaca dari tabel rollup harian yang di-update bersama transaksi tiket.
+import math
+from sqlalchemy import func, case, and_, extract, literal_column, insert
+
+import storage
+import cache
+
+METRIC_COLUMNS = [
+    "registered_count", "checkin_count", "completed_count",
+    "wait_count", "wait_sum", "wait_sumsq",
+    "service_count", "service_sum", "service_sumsq",
+    "pair_count", "pair_wait_sum", "pair_service_sum",
+    "pair_wait_sumsq", "pair_service_sumsq", "pair_cross_sum",
+]
+
+def minutes_between(start, end, dialect: str):
+    """Selisih dua kolom DateTime dalam menit (NULL jika salah satu kosong)."""
+    if dialect == "sqlite":
+        return (func.julianday(end) - func.julianday(start)) * 1440.0
+    return func.timestampdiff(literal_column("MICROSECOND"), start, end) / 60000000.0
+
+def metric_expressions(t, dialect: str):
+    """Ekspresi agregat untuk semua kolom METRIC_COLUMNS dari tabel kunjungan t."""
+    wait = minutes_between(t.checkin_time, t.clinic_entry_time, dialect)
+    svc = minutes_between(t.clinic_entry_time, t.completion_time, dialect)
+    # Pasangan valid = durasi tunggu & layanan sama-sama ada dan tidak minus
+    valid = and_(wait >= 0, svc >= 0)
+    return [
+        func.count().label("registered_count"),
+        func.count(t.checkin_time).label("checkin_count"),
+        func.count(t.completion_time).label("completed_count"),
+        func.count(wait).label("wait_count"),
+        func.sum(wait).label("wait_sum"),
+        func.sum(wait * wait).label("wait_sumsq"),
+        func.count(svc).label("service_count"),
+        func.sum(svc).label("service_sum"),
+        func.sum(svc * svc).label("service_sumsq"),
+        func.sum(case((valid, 1), else_=0)).label("pair_count"),
+        func.sum(case((valid, wait))).label("pair_wait_sum"),
+        func.sum(case((valid, svc))).label("pair_service_sum"),
+        func.sum(case((valid, wait * wait))).label("pair_wait_sumsq"),
+        func.sum(case((valid, svc * svc))).label("pair_service_sumsq"),
+        func.sum(case((valid, wait * svc))).label("pair_cross_sum"),
+    ]
+
+def aggregate_visits(db, start_date=None, end_date=None, by_day=False, table=None):
+    """Ringkasan kunjungan per (poli, dokter, jam check-in) dihitung di database."""
+    t = table or storage.TabelPelayanan
+    hour = extract("hour", t.checkin_time).label("hour")
+    keys = [t.poli, t.dokter, hour]
+    if by_day: keys = [t.visit_date, t.doctor_id_ref] + keys
+    q = db.query(*keys, *metric_expressions(t, db.bind.dialect.name))
+    if start_date: q = q.filter(t.visit_date >= start_date)
+    if end_date: q = q.filter(t.visit_date <= end_date)
+    return q.group_by(*keys).all()
+
+def aggregate_rollups(db, start_date=None, end_date=None):
+    """Sama seperti aggregate_visits, tapi menjumlahkan tabel rollup (jauh lebih kecil)."""
+    t = storage.TabelRollupHarian
+    q = db.query(t.poli, t.dokter, t.hour, *[func.sum(getattr(t, c)).label(c) for c in METRIC_COLUMNS])
+    if start_date: q = q.filter(t.visit_date >= start_date)
+    if end_date: q = q.filter(t.visit_date <= end_date)
+    return q.group_by(t.poli, t.dokter, t.hour).all()
+
+def _pearson(n, sx, sy, sxx, syy, sxy):
+    if n <= 1: return 0
+    den = math.sqrt(max(n * sxx - sx * sx, 0) * max(n * syy - sy * sy, 0))
+    if den == 0: return 0
+    return round((n * sxy - sx * sy) / den, 2)
+
+def build_report(rows, term_frequencies: dict):
+    """Susun response /analytics/comprehensive-report dari baris ringkasan."""
+    total = sum(r.registered_count or 0 for r in rows)
+    if not total: return {"status": "No Data"}
+
+    volume, peak, poli_acc, doc_acc = {}, {}, {}, {}
+    pair = [0, 0.0, 0.0, 0.0, 0.0, 0.0]
+    checked_in = 0
+
+    for r in rows:
+        volume[r.poli] = volume.get(r.poli, 0) + (r.registered_count or 0)
+        checked_in += r.checkin_count or 0
+        if r.hour is not None and r.hour >= 0 and r.checkin_count:
+            h = int(r.hour)
+            peak[h] = peak.get(h, 0) + r.checkin_count
+
+        acc = poli_acc.setdefault(r.poli, [0, 0.0, 0, 0.0])
+        acc[0] += r.wait_count or 0; acc[1] += r.wait_sum or 0
+        acc[2] += r.service_count or 0; acc[3] += r.service_sum or 0
+
+        if r.pair_count:
+            d = doc_acc.setdefault(r.dokter, [0, 0.0])
+            d[0] += r.pair_count; d[1] += r.pair_service_sum or 0
+            for i, v in enumerate([r.pair_count, r.pair_wait_sum, r.pair_service_sum,
+                                   r.pair_wait_sumsq, r.pair_service_sumsq, r.pair_cross_sum]):
+                pair[i] += v or 0
+
+    def mean(cnt, s): return round(s / cnt, 1) if cnt else 0
+
+    throughput = {}
+    for doc in sorted(doc_acc, key=str):
+        m = doc_acc[doc][1] / doc_acc[doc][0]
+        throughput[doc] = round(60 / m, 1) if m > 0 else 0
+
+    return {
+        "status": "Success",
+        "total_patients": total,
+        "poli_volume": dict(sorted(((k, v) for k, v in volume.items() if k is not None), key=lambda x: -x[1])),
+        "peak_hours": dict(sorted(peak.items())),
+        "ghost_rate": round((total - checked_in) / total * 100, 1),
+        "doctor_throughput": throughput,
+        "poli_efficiency": {
+            p: {"wait_minutes": mean(a[0], a[1]), "service_minutes": mean(a[2], a[3])}
+            for p, a in poli_acc.items()
+        },
+        "correlation": _pearson(*pair),
+        "term_frequencies": term_frequencies
+    }
+
+# =================================================================
+# ROLLUP HARIAN (di-update di transaksi yang sama dengan tiket)
+# =================================================================
+
+def _minutes(start, end):
+    return (end - start).total_seconds() / 60 if start and end else None
+
+def _stage_deltas(t, stage: str) -> dict:
+    """Delta metrik rollup saat tiket t mencapai tahap register/arrival/clinic/finish."""
+    if stage == "register":
+        return {"registered_count": 1}
+    if stage == "arrival":
+        return {"checkin_count": 1} if t.checkin_time else {}
+    if stage == "clinic":
+        w = _minutes(t.checkin_time, t.clinic_entry_time)
+        return {} if w is None else {"wait_count": 1, "wait_sum": w, "wait_sumsq": w * w}
+    if stage == "finish":
+        d = {"completed_count": 1} if t.completion_time else {}
+        s = _minutes(t.clinic_entry_time, t.completion_time)
+        if s is not None:
+            d.update(service_count=1, service_sum=s, service_sumsq=s * s)
+            w = _minutes(t.checkin_time, t.clinic_entry_time)
+            if w is not None and w >= 0 and s >= 0:
+                d.update(pair_count=1, pair_wait_sum=w, pair_service_sum=s,
+                         pair_wait_sumsq=w * w, pair_service_sumsq=s * s, pair_cross_sum=w * s)
+        return d
+    return {}
+
+def _apply(db, t, hour: int, deltas: dict):
+    if not deltas: return
+    storage.upsert_increment(
+        db, storage.TabelRollupHarian,
+        {"visit_date": t.visit_date, "poli": t.poli, "doctor_id": t.doctor_id_ref, "hour": hour},
+        deltas, {"dokter": t.dokter}
+    )
+
+def record_stage(db, t, stage: str):
+    """Dipanggil submit_reg (register) dan scan_barcode (arrival/clinic/finish) sebelum commit."""
+    hour = -1 if stage == "register" or not t.checkin_time else t.checkin_time.hour
+    _apply(db, t, hour, _stage_deltas(t, stage))
+
+def visit_deltas(t) -> list:
+    """Delta rollup satu kunjungan lengkap: [(jam, delta), ...]."""
+    deltas = {}
+    for stage in ["arrival", "clinic", "finish"]:
+        deltas.update(_stage_deltas(t, stage))
+    return [(-1, _stage_deltas(t, "register")), (t.checkin_time.hour if t.checkin_time else -1, deltas)]
+
+def record_visit(db, t):
+    """Catat satu kunjungan lengkap sekaligus (dipakai import data)."""
+    for hour, deltas in visit_deltas(t):
+        _apply(db, t, hour, deltas)
+
+def record_visits(db, tickets) -> int:
+    """Versi massal record_visit: jumlahkan delta di memori, lalu tulis semua bucket sekaligus."""
+    buckets = {}
+    for t in tickets:
+        for hour, deltas in visit_deltas(t):
+            if not deltas: continue
+            key = (t.visit_date, t.poli, t.doctor_id_ref, hour)
+            acc = buckets.setdefault(key, ({"dokter": t.dokter}, {}))[1]
+            for c, v in deltas.items(): acc[c] = acc.get(c, 0) + v
+
+    storage.bulk_increment(db, storage.TabelRollupHarian, [
+        ({"visit_date": d, "poli": poli, "doctor_id": doc_id, "hour": hour}, deltas, extra)
+        for (d, poli, doc_id, hour), (extra, deltas) in buckets.items()])
+    return len(buckets)
+
+def rebuild_rollups(db) -> int:
+    """Hitung ulang seluruh rollup dari TabelPelayanan + arsip (backfill / perbaikan drift)."""
+    rollups = {}
+
+    def bucket(r, hour):
+        k = (r.visit_date, r.poli, r.doctor_id_ref, hour)
+        if k not in rollups:
+            rollups[k] = {"visit_date": r.visit_date, "poli": r.poli, "doctor_id": r.doctor_id_ref,
+                          "hour": hour, "dokter": r.dokter, **{c: 0 for c in METRIC_COLUMNS}}
+        return rollups[k]
+
+    skipped = 0
+    for table in storage.VISIT_TABLES:
+        for r in aggregate_visits(db, by_day=True, table=table):
+            if r.poli is None or r.doctor_id_ref is None:
+                skipped += r.registered_count; continue
+            row = bucket(r, -1 if r.hour is None else int(r.hour))
+            for c in METRIC_COLUMNS[1:]:
+                row[c] += getattr(r, c) or 0
+            # Pendaftaran selalu dicatat di bucket -1, sama seperti jalur incremental
+            bucket(r, -1)["registered_count"] += r.registered_count
+
+    db.query(storage.TabelRollupHarian).delete(synchronize_session=False)
+    if rollups:
+        db.execute(insert(storage.TabelRollupHarian), list(rollups.values()))
+    cache.report_cache.bump(db)
+    db.commit()
+    if skipped: print(f"⚠️ {skipped} kunjungan tanpa poli/dokter dilewati.")
+    return len(rollups)
+
+if __name__ == "__main__":
+    db = storage.SessionLocal()
+    try:
+        print(f"✅ Rollup dibangun ulang: {rebuild_rollups(db)} baris.")
+    finally:
+        db.close()
@@ -0,0 +1,190 @@
+# FILE: archive_import.py
+# Import arsip kunjungan asli (format tabel_pelayanan_normal.csv) ke database.
+# CSV dibaca per chunk, jadi memori tetap datar walau file berukuran GB.
+# Baris yang tidak valid ditulis ke file samping "<nama>.rejects.csv" beserta alasannya.
+#
+#   python archive_import.py tabel_pelayanan_normal.csv --chunk-size 20000
+import argparse
+import os
+import time as time_lib
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, tuple_
+
+import storage
+import schemas
+import cache
+import live_queue
+import analytics
+import text_mining
+import gabungan_sync
+import visit_counters
+
+CHUNK_SIZE = 20000
+REQUIRED_COLUMNS = ["nama_pasien", "poli", "dokter", "visit_date", "status_pelayanan", "queue_number"]
+TIME_COLUMNS = ["checkin_time", "clinic_entry_time", "completion_time"]
+OPTIONAL_COLUMNS = ["queue_sequence", "username", "catatan_medis", "status_member"] + TIME_COLUMNS
+VALID_STATUSES = {"Terdaftar", "Menunggu", "Sedang Dilayani", "Selesai"}
+
+class ReferenceMaps:
+    """Lookup dokter per (poli, nama) di memori (sekali query di awal import)."""
+
+    def __init__(self, db):
+        self.doctors = {(d.poli, d.dokter): d for d in db.query(storage.TabelDokter).all()}
+
+    def doctor(self, poli: str, dokter: str):
+        return self.doctors.get((poli, dokter))
+
+def _parse_times(dates: pd.Series, values: pd.Series) -> pd.Series:
+    """Kolom waktu bisa berupa jam saja (format arsip, digabung dengan visit_date) atau datetime lengkap."""
+    values = values.str.strip()
+    time_only = ~values.str.contains(r"[-/T]", regex=True) & (values != "")
+    full = values.where(~time_only, dates.dt.strftime("%Y-%m-%d") + " " + values)
+    return pd.to_datetime(full.replace("", None), errors="coerce", format="mixed")
+
+def prepare_chunk(raw: pd.DataFrame, refs: ReferenceMaps):
+    """Validasi & resolve satu chunk. Return (DataFrame valid, DataFrame ditolak + kolom alasan)."""
+    df = raw.copy()
+    for c in OPTIONAL_COLUMNS:
+        if c not in df: df[c] = ""
+    reason = pd.Series("", index=df.index)
+
+    def reject(mask, msg):
+        nonlocal reason
+        reason = reason.where(~(mask & (reason == "")), msg)
+
+    for c in REQUIRED_COLUMNS:
+        reject(df[c].str.strip() == "", f"Kolom {c} kosong")
+
+    df["poli"] = df["poli"].map(schemas.format_poli_name)
+    df["dokter"] = df["dokter"].map(schemas.format_doctor_title)
+    df["visit_date"] = pd.to_datetime(df["visit_date"].str.strip(), errors="coerce", format="mixed")
+    reject(df["visit_date"].isna(), "visit_date tidak valid")
+
+    for c in TIME_COLUMNS:
+        parsed = _parse_times(df["visit_date"], df[c])
+        reject(parsed.isna() & (df[c].str.strip() != ""), f"{c} tidak valid")
+        df[c] = parsed
+
+    df["status_pelayanan"] = df["status_pelayanan"].str.strip()
+    reject(~df["status_pelayanan"].isin(VALID_STATUSES), "status_pelayanan tidak dikenal")
+
+    df["queue_sequence"] = pd.to_numeric(df["queue_sequence"], errors="coerce")
+    missing_seq = df["queue_sequence"].isna()
+    df.loc[missing_seq, "queue_sequence"] = pd.to_numeric(
+        df.loc[missing_seq, "queue_number"].str.rsplit("-", n=1).str[-1], errors="coerce")
+    reject(df["queue_sequence"].isna(), "queue_sequence tidak valid")
+
+    docs = [refs.doctor(p, d) for p, d in zip(df["poli"], df["dokter"])]
+    reject(pd.Series([d is None for d in docs], index=df.index), "Dokter/poli tidak terdaftar")
+    df["doc"] = docs
+
+    # Duplikat (visit_date, queue_number) di dalam chunk: ambil yang pertama
+    df["queue_number"] = df["queue_number"].str.strip()
+    reject(df.duplicated(["visit_date", "queue_number"]) & (reason == ""), "Duplikat nomor antrean di file")
+
+    rejected = raw.loc[reason != ""].assign(alasan=reason[reason != ""])
+    return df.loc[reason == ""], rejected
+
+def _existing_numbers(db, df: pd.DataFrame) -> set:
+    keys = list({(d.date(), q) for d, q in zip(df["visit_date"], df["queue_number"])})
+    found = set()
+    # Kunjungan lama mungkin sudah dipindah ke arsip (visit_archive.py)
+    for t in storage.VISIT_TABLES:
+        for i in range(0, len(keys), 1000):
+            found.update(db.query(t.visit_date, t.queue_number)
+                         .filter(tuple_(t.visit_date, t.queue_number).in_(keys[i:i + 1000])).all())
+    return found
+
+def _none(v):
+    return None if v is None or v is pd.NaT or v == "" or (isinstance(v, float) and np.isnan(v)) else v
+
+def _rows(df: pd.DataFrame) -> list:
+    rows = []
+    for r in df.itertuples(index=False):
+        d = r.doc
+        rows.append({
+            "username": _none(r.username), "nama_pasien": r.nama_pasien.strip(), "poli": d.poli,
+            "dokter": d.dokter, "doctor_id_ref": d.doctor_id, "visit_date": r.visit_date.date(),
+            "checkin_time": _none(r.checkin_time) and r.checkin_time.to_pydatetime(),
+            "clinic_entry_time": _none(r.clinic_entry_time) and r.clinic_entry_time.to_pydatetime(),
+            "completion_time": _none(r.completion_time) and r.completion_time.to_pydatetime(),
+            "status_pelayanan": r.status_pelayanan, "queue_number": r.queue_number,
+            "queue_sequence": int(r.queue_sequence), "catatan_medis": _none(r.catatan_medis),
+            "status_member": _none(r.status_member),
+        })
+    return rows
+
+def import_pelayanan_csv(db, source, chunk_size: int = CHUNK_SIZE, rejects_path: str = None) -> dict:
+    """Stream CSV arsip pelayanan ke TabelPelayanan (satu commit per chunk); TabelGabungan lewat outbox."""
+    refs = ReferenceMaps(db)
+    pel_cols = {c.name for c in storage.TabelPelayanan.__table__.columns} - {"id"}
+    stats = {"read": 0, "inserted": 0, "rejected": 0}
+    header_written = rejects_path is not None and os.path.exists(rejects_path)
+    t0 = time_lib.perf_counter()
+
+    reader = pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False, on_bad_lines="skip")
+    for raw in reader:
+        raw = raw.loc[:, ~raw.columns.str.contains('^Unnamed')]
+        missing = [c for c in REQUIRED_COLUMNS if c not in raw.columns]
+        if missing: raise ValueError(f"Kolom wajib tidak ada di CSV: {', '.join(missing)}")
+        stats["read"] += len(raw)
+
+        valid, rejected = prepare_chunk(raw, refs)
+        if len(valid):
+            # Sudah ada di database (import ulang / tiket yang dibuat aplikasi)
+            dup = _existing_numbers(db, valid)
+            is_dup = pd.Series([(d.date(), q) in dup for d, q in zip(valid["visit_date"], valid["queue_number"])],
+                               index=valid.index, dtype=bool)
+            rejected = pd.concat([rejected, raw.loc[valid.index[is_dup]].assign(alasan="Nomor antrean sudah ada di database")])
+            valid = valid.loc[~is_dup]
+
+        rows = _rows(valid)
+        if rows:
+            last_id = gabungan_sync.last_pelayanan_id(db)
+            db.execute(insert(storage.TabelPelayanan), [{k: r[k] for k in pel_cols} for r in rows])
+            gabungan_sync.enqueue_since(db, last_id)
+            tickets = [SimpleNamespace(**r) for r in rows]
+            visit_counters.add_visits(db, tickets)
+            analytics.record_visits(db, tickets)
+            text_mining.record_notes(db, [(r["visit_date"], r["catatan_medis"]) for r in rows if r["catatan_medis"]])
+
+            # Counter antrean tidak boleh tertinggal dari nomor yang baru dimasukkan
+            top = {}
+            for r in rows:
+                k = (r["doctor_id_ref"], r["visit_date"])
+                top[k] = max(top.get(k, 0), r["queue_sequence"])
+            for (doc_id, d), seq in top.items():
+                storage.bump_queue_sequence(db, doc_id, d, seq)
+            cache.report_cache.bump(db) # Laporan range lampau di semua worker ikut dibuang
+            live_queue.touch(db, *{r["visit_date"] for r in rows})
+            db.commit()
+
+        if len(rejected) and rejects_path:
+            rejected.to_csv(rejects_path, mode="a", header=not header_written, index=False)
+            header_written = True
+
+        stats["inserted"] += len(rows)
+        stats["rejected"] += len(rejected)
+        rate = stats["read"] / max(time_lib.perf_counter() - t0, 1e-9)
+        print(f"📥 Import arsip: {stats['read']} dibaca, {stats['inserted']} masuk, "
+              f"{stats['rejected']} ditolak ({rate:,.0f} baris/detik)")
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import CSV arsip tabel_pelayanan ke database.")
+    parser.add_argument("path", help="File CSV pelayanan")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--rejects", default=None, help="File baris yang ditolak (default: <path>.rejects.csv)")
+    args = parser.parse_args()
+
+    db = storage.SessionLocal()
+    try:
+        res = import_pelayanan_csv(db, args.path, args.chunk_size, args.rejects or args.path + ".rejects.csv")
+        while gabungan_sync.worker.run_once(db): pass # Salin ke TabelGabungan
+        print(f"✅ Selesai: {res['inserted']} baris masuk, {res['rejected']} ditolak.")
+        if res["rejected"]: print(f"ℹ️ Detail baris ditolak: {args.rejects or args.path + '.rejects.csv'}")
+    finally:
+        db.close()
@@ -0,0 +1,183 @@
+# FILE: cache.py
+# Cache in-process untuk hasil yang mahal dihitung ulang.
+import threading
+import time as time_lib
+from collections import OrderedDict
+from datetime import date
+from types import SimpleNamespace
+
+import storage
+
+REPORT_META_KEY = "report_version"
+
+class ReportCache:
+    """LRU cache laporan analitik dengan key (start_date, end_date).
+
+    Range yang berakhir sebelum hari ini tidak diberi TTL; yang mencakup hari
+    ini/tanpa batas akhir diberi TTL pendek sebagai pengaman multi-worker. Tulisan
+    di proses ini membuang entry yang range-nya mencakup tanggal tersebut. Tulisan
+    ke tanggal lampau juga menaikkan stempel report_version di tabel_meta, sehingga
+    worker lain membuang cache-nya (dicek paling sering sekali per `check_seconds`).
+    """
+
+    def __init__(self, max_entries: int = 128, live_ttl: int = 30, check_seconds: float = 5.0):
+        self.max_entries = max_entries
+        self.live_ttl = live_ttl
+        self.check_seconds = check_seconds
+        self._data = OrderedDict() # key -> (value, expires_at | None)
+        self._lock = threading.Lock()
+        self.generation = 0 # Naik setiap invalidasi, mencegah simpan hasil basi
+        self._stamp = None # report_version yang sudah tercermin di cache ini
+        self._checked_at = 0.0
+        self.hits = self.misses = self.invalidations = 0
+
+    def sync(self, db):
+        """Buang semua entry jika worker lain menulis ke tanggal lampau sejak pengecekan terakhir."""
+        if time_lib.monotonic() - self._checked_at < self.check_seconds: return
+        stamp = storage.get_meta(db, REPORT_META_KEY)
+        with self._lock:
+            self._checked_at = time_lib.monotonic()
+            if self._stamp is not None and stamp != self._stamp:
+                self.generation += 1
+                self.invalidations += len(self._data)
+                self._data.clear()
+            self._stamp = stamp
+
+    def bump(self, db):
+        """Panggil di transaksi yang menulis data tanggal lampau (import, scan mundur, ganti nama dokter)."""
+        storage.bump_meta(db, REPORT_META_KEY)
+        stamp = storage.get_meta(db, REPORT_META_KEY)
+        storage.on_commit(db, lambda: self._seen(stamp))
+
+    def _seen(self, stamp: int):
+        # Tulisan sendiri tidak perlu membuang seluruh cache (sudah diinvalidasi per tanggal)
+        with self._lock:
+            if self._stamp == stamp - 1: self._stamp = stamp
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item and (item[1] is None or item[1] > time_lib.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item: del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, generation: int):
+        """Simpan hasil yang dihitung saat `generation` masih berlaku."""
+        start, end = key
+        expires = None if end is not None and end < date.today() else time_lib.monotonic() + self.live_ttl
+        with self._lock:
+            if generation != self.generation: return
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, dates):
+        """Buang entry yang range-nya mencakup salah satu tanggal yang ditulis."""
+        dates = set(dates)
+        with self._lock:
+            self.generation += 1
+            for (start, end) in list(self._data):
+                if any((start is None or start <= d) and (end is None or d <= end) for d in dates):
+                    del self._data[(start, end)]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / total * 100, 1) if total else 0.0,
+                "version": self._stamp,
+            }
+
+report_cache = ReportCache()
+
+
+# [BARU] Data referensi poli & dokter (jarang berubah, dibaca di hampir setiap request)
+REFERENCE_META_KEY = "reference_version"
+
+class ReferenceData:
+    """Snapshot read-only poli & dokter, diindeks per id, nama, dan poli."""
+
+    def __init__(self, version: int, polis, doctors):
+        self.version = version
+        self.polis = {p.poli: p for p in polis} # poli -> record
+        self.doctors = {d.doctor_id: d for d in doctors} # doctor_id -> record
+        self.doctors_by_name = {d.dokter: d for d in doctors}
+        self.doctors_by_poli = {}
+        for d in doctors: self.doctors_by_poli.setdefault(d.poli, []).append(d)
+
+def _record(row, model) -> SimpleNamespace:
+    return SimpleNamespace(**{c.name: getattr(row, c.name) for c in model.__table__.columns})
+
+class ReferenceCache:
+    """Cache data referensi per proses.
+
+    Tulisan admin di proses ini langsung membuang cache (setelah commit). Worker
+    lain mendeteksi perubahan lewat stempel versi di tabel_meta, dicek paling
+    sering sekali per `check_seconds`.
+    """
+
+    def __init__(self, check_seconds: float = 5.0):
+        self.check_seconds = check_seconds
+        self._data = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.generation = 0 # Naik setiap invalidasi, mencegah simpan hasil basi
+        self.hits = self.loads = self.invalidations = 0
+
+    def get(self, db) -> ReferenceData:
+        data = self._data
+        if data is not None and time_lib.monotonic() - self._checked_at < self.check_seconds:
+            self.hits += 1
+            return data
+
+        gen = self.generation
+        version = storage.get_meta(db, REFERENCE_META_KEY)
+        if data is None or data.version != version:
+            # Stempel dibaca dulu -> data yang dimuat minimal sebaru stempel tersebut
+            data = ReferenceData(
+                version,
+                [_record(p, storage.TabelPoli) for p in db.query(storage.TabelPoli).order_by(storage.TabelPoli.poli)],
+                [_record(d, storage.TabelDokter) for d in db.query(storage.TabelDokter).order_by(storage.TabelDokter.doctor_id)],
+            )
+            self.loads += 1
+        else:
+            self.hits += 1
+        with self._lock:
+            if gen == self.generation:
+                self._data, self._checked_at = data, time_lib.monotonic()
+        return data
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._data = None
+            self.invalidations += 1
+
+    def bump(self, db):
+        """Panggil di transaksi yang mengubah poli/dokter: naikkan stempel + buang cache setelah commit."""
+        storage.bump_meta(db, REFERENCE_META_KEY)
+        storage.on_commit(db, self.invalidate)
+
+    def stats(self) -> dict:
+        data = self._data
+        return {
+            "version": data.version if data else None,
+            "polis": len(data.polis) if data else 0, "doctors": len(data.doctors) if data else 0,
+            "hits": self.hits, "loads": self.loads, "invalidations": self.invalidations,
+        }
+
+reference_cache = ReferenceCache()
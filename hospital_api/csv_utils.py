@@ -1,44 +1,179 @@
 import pandas as pd
 import os
 import csv
+import gzip
+import glob
+import hashlib
+import tempfile
+import threading
+from datetime import date
 
 FILE_POLI = "tabel_poli_normal.csv"
 FILE_DOKTER = "tabel_dokter_normal.csv"
 FILE_PELAYANAN = "tabel_pelayanan_normal.csv"
 
-def get_merged_random_data(count: int):
-    if not (os.path.exists(FILE_POLI) and os.path.exists(FILE_DOKTER) and os.path.exists(FILE_PELAYANAN)):
-        raise FileNotFoundError("File CSV tidak lengkap.")
-    
-    # Baca dengan skip error
-    df_poli = pd.read_csv(FILE_POLI, on_bad_lines='skip')
-    df_dokter = pd.read_csv(FILE_DOKTER, on_bad_lines='skip')
-    df_layanan = pd.read_csv(FILE_PELAYANAN, on_bad_lines='skip')
+# Cache hasil parse CSV: path -> (signature file, DataFrame bersih)
+# Signature = (mtime_ns, size) sehingga CSV yang diedit otomatis dibaca ulang.
+_FRAME_CACHE = {}
+# Salinan parquet hasil parse (jauh lebih cepat dimuat setelah restart), di luar folder source.
+# Parquet, bukan pickle: isi folder cache tidak bisa menjalankan kode saat dimuat.
+CSV_CACHE_DIR = os.path.abspath(os.getenv("CSV_CACHE_DIR", os.path.join(tempfile.gettempdir(), "hospital_api_csv_cache")))
+SIDECAR_SUFFIX = ".parquet"
 
+def _file_signature(path: str):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+def _parse_csv(path: str) -> pd.DataFrame:
+    # Baca dengan skip error
+    df = pd.read_csv(path, on_bad_lines='skip')
     # Cleaning Unnamed columns
-    df_poli = df_poli.loc[:, ~df_poli.columns.str.contains('^Unnamed')]
-    df_dokter = df_dokter.loc[:, ~df_dokter.columns.str.contains('^Unnamed')]
-    df_layanan = df_layanan.loc[:, ~df_layanan.columns.str.contains('^Unnamed')]
-
-    for df in [df_poli, df_dokter, df_layanan]:
-        for col in df.select_dtypes(include=['object']).columns:
-            df[col] = df[col].str.strip()
-
-    # Return raw dataframes for main.py to handle
-    return df_dokter, df_layanan
-
-def append_to_csv(filename: str, data: dict):
-    file_exists = os.path.isfile(filename)
-    field_order = []
-    if "dokter" in filename: 
-        field_order = ["dokter", "doctor_id", "practice_start_time", "practice_end_time", "doctor_code", "max_patients", "poli", "prefix"]
-    elif "poli" in filename: 
-        field_order = ["poli", "prefix"]
-    elif "pelayanan" in filename: 
-        field_order = ["nama_pasien", "poli", "dokter", "visit_date", "checkin_time", "clinic_entry_time", "completion_time", "status_pelayanan", "queue_number", "queue_sequence"]
-    
-    with open(filename, mode='a', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=field_order)
-        if not file_exists: writer.writeheader()
-        row = {k: v for k, v in data.items() if k in field_order}
-        writer.writerow(row)
\ No newline at end of file
+    df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
+    for col in df.select_dtypes(include=['object']).columns:
+        df[col] = df[col].str.strip()
+    return df
+
+def _sidecar_path(path: str, sig) -> str:
+    # Nama file + hash path lengkap (CSV bernama sama di folder berbeda tidak saling timpa) + signature
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:10]
+    return os.path.join(CSV_CACHE_DIR, f"{os.path.basename(path)}.{key}.{sig[0]}-{sig[1]}{SIDECAR_SUFFIX}")
+
+def load_clean_csv(path: str) -> pd.DataFrame:
+    """DataFrame bersih dari CSV, di-cache per (path, mtime, size). Jangan diubah in-place."""
+    sig = _file_signature(path)
+    hit = _FRAME_CACHE.get(path)
+    if hit and hit[0] == sig: return hit[1]
+
+    sidecar = _sidecar_path(path, sig)
+    df = None
+    try:
+        df = pd.read_parquet(sidecar)
+    except Exception:
+        pass # Sidecar belum ada / rusak -> parse ulang
+
+    if df is None:
+        df = _parse_csv(path)
+        try:
+            os.makedirs(CSV_CACHE_DIR, exist_ok=True)
+            # Signature lama (CSV sudah diedit) tidak akan dibaca lagi
+            for old in glob.glob(sidecar.rsplit(".", 2)[0] + ".*" + SIDECAR_SUFFIX): os.remove(old)
+            df.to_parquet(sidecar + ".tmp", index=False)
+            os.replace(sidecar + ".tmp", sidecar)
+        except (OSError, ImportError, ValueError) as e:
+            print(f"⚠️ Gagal menulis cache {sidecar}: {e}")
+
+    _FRAME_CACHE[path] = (sig, df)
+    return df
+
+def get_merged_random_data(count: int):
+    """DataFrame dokter (sumber poli & dokter untuk import acak); pasien dibuat Faker."""
+    if not os.path.exists(FILE_DOKTER):
+        raise FileNotFoundError(f"File CSV dokter tidak ditemukan: {FILE_DOKTER}")
+    return load_clean_csv(FILE_DOKTER)
+
+# =================================================================
+# ARSIP CSV WRITE-BEHIND (pengganti append_to_csv per baris)
+# =================================================================
+
+# Skema eksplisit per tabel arsip (urutan kolom = header CSV)
+ARCHIVE_SCHEMAS = {
+    "dokter": ["dokter", "doctor_id", "practice_start_time", "practice_end_time", "doctor_code", "max_patients", "poli", "prefix"],
+    "poli": ["poli", "prefix"],
+    "pelayanan": ["nama_pasien", "poli", "dokter", "visit_date", "checkin_time", "clinic_entry_time", "completion_time", "status_pelayanan", "queue_number", "queue_sequence"],
+}
+
+class ArchiveWriter:
+    """Tulis baris arsip di background thread: file tetap terbuka, baris di-buffer,
+    flush saat buffer penuh (max_rows) atau tiap flush_seconds, rotasi file per hari
+    (<dir>/<tabel>_<YYYY-MM-DD>.csv[.gz]).
+
+    write() hanya menaruh baris di buffer memori, tidak ada I/O file di jalur request.
+    """
+
+    def __init__(self, directory: str, schemas: dict = None, max_rows: int = 500,
+                 flush_seconds: float = 5.0, compress: bool = False):
+        self.directory = directory
+        self.schemas = schemas or ARCHIVE_SCHEMAS
+        self.max_rows = max_rows
+        self.flush_seconds = flush_seconds
+        self.compress = compress
+        self._buffer = [] # (tabel, tanggal, row)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self._files = {} # tabel -> (tanggal, file, csv.writer)
+        self._thread = None
+        self.written = self.flushes = self.errors = 0
+
+    def start(self):
+        """Buka lagi setelah close() (startup aplikasi berikutnya di proses yang sama)."""
+        with self._lock:
+            self._stop = False
+            self._thread = None # Thread baru dibuat oleh write() berikutnya
+
+    def write(self, table: str, row: dict):
+        if table not in self.schemas: raise ValueError(f"Tabel arsip tidak dikenal: {table}")
+        with self._lock:
+            # Setelah close() tidak ada lagi yang mem-flush buffer -> tolak, jangan hilang diam-diam
+            if self._stop: raise RuntimeError("ArchiveWriter sudah ditutup")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="archive-writer", daemon=True)
+                self._thread.start()
+            self._buffer.append((table, date.today(), row))
+            if len(self._buffer) >= self.max_rows: self._wake.set()
+
+    def _run(self):
+        while not self._stop:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def _file_for(self, table: str, day: date):
+        cur = self._files.get(table)
+        if cur and cur[0] == day: return cur[2]
+        if cur: cur[1].close() # Rotasi harian
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{table}_{day.isoformat()}.csv" + (".gz" if self.compress else ""))
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        f = gzip.open(path, "at", newline="", encoding="utf-8") if self.compress \
+            else open(path, "a", newline="", encoding="utf-8")
+        writer = csv.DictWriter(f, fieldnames=self.schemas[table], extrasaction="ignore")
+        if is_new: writer.writeheader()
+        self._files[table] = (day, f, writer)
+        return writer
+
+    def flush(self):
+        """Tulis semua baris di buffer ke file (dipanggil thread background / saat shutdown)."""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows: return
+        try:
+            for table, day, row in rows:
+                self._file_for(table, day).writerow(row)
+            for _, f, _ in self._files.values(): f.flush()
+            self.written += len(rows)
+            self.flushes += 1
+        except OSError as e:
+            self.errors += 1
+            print(f"⚠️ Gagal menulis arsip CSV ({len(rows)} baris): {e}")
+
+    def close(self):
+        with self._lock: self._stop = True
+        self._wake.set()
+        if self._thread: self._thread.join(timeout=self.flush_seconds + 1)
+        self.flush()
+        for _, f, _ in self._files.values(): f.close()
+        self._files.clear()
+
+    def stats(self) -> dict:
+        with self._lock: pending = len(self._buffer)
+        return {"pending": pending, "written": self.written, "flushes": self.flushes, "errors": self.errors}
+
+# Aktif hanya jika ARCHIVE_DIR di-set (ARCHIVE_GZIP=1 untuk kompresi)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR")
+archive_writer = ArchiveWriter(ARCHIVE_DIR, compress=os.getenv("ARCHIVE_GZIP") == "1") if ARCHIVE_DIR else None
+
+def archive(table: str, row: dict):
+    """Kirim baris ke arsip CSV (no-op jika arsip tidak diaktifkan)."""
+    if archive_writer: archive_writer.write(table, row)
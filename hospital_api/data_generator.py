@@ -0,0 +1,214 @@
+# FILE: data_generator.py
+# Generator kunjungan sintetis (NumPy, vektor) untuk dataset uji beban / benchmark.
+# Distribusi sama dengan /admin/import-random-data, tapi N baris diundi sekaligus per chunk.
+#
+#   python data_generator.py 100000 --seed 42                # langsung ke database
+#   python data_generator.py 1000000 --csv kunjungan.csv      # ke CSV (format arsip pelayanan)
+import argparse
+import csv
+import time as time_lib
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from faker import Faker
+from sqlalchemy import insert
+
+import storage
+import security
+import cache
+import live_queue
+import analytics
+import text_mining
+import gabungan_sync
+import visit_counters
+
+CHUNK_SIZE = 10000
+TODAY_RATE = 0.4 # 40% kunjungan jatuh hari ini
+TODAY_STATUSES = ["Menunggu", "Sedang Dilayani", "Selesai"]
+TODAY_WEIGHTS = [0.4, 0.3, 0.3]
+NOTE_OPTIONS = ["Demam", "Flu", "Batuk", "Cek Darah", "Pusing", "Sakit Gigi", "Asam Lambung", "Sehat", "Kontrol Rutin"]
+NAME_POOL_SIZE = 2000
+
+# Format sama dengan tabel_pelayanan_normal.csv (+ kolom tambahan di belakang)
+CSV_COLUMNS = [
+    "nama_pasien", "poli", "dokter", "visit_date", "checkin_time", "clinic_entry_time",
+    "completion_time", "status_pelayanan", "queue_sequence", "queue_number",
+    "username", "catatan_medis", "status_member",
+]
+
+def load_doctors(db) -> pd.DataFrame:
+    """Dokter + prefix poli dari database (sumber nomor antrean & doctor_id)."""
+    rows = db.query(storage.TabelDokter, storage.TabelPoli.prefix)\
+        .join(storage.TabelPoli, storage.TabelDokter.poli == storage.TabelPoli.poli).all()
+    return pd.DataFrame([{
+        "doctor_id": d.doctor_id, "dokter": d.dokter, "poli": d.poli,
+        "prefix": prefix, "suffix": (d.doctor_code or "001").split('-')[-1],
+    } for d, prefix in rows])
+
+class VisitGenerator:
+    """Undi kunjungan per chunk. Seed sama -> dataset sama."""
+
+    def __init__(self, doctors: pd.DataFrame, seed: int = None, days: int = 30, today: date = None):
+        if doctors.empty:
+            raise ValueError("Belum ada data dokter. Jalankan import / tambah dokter dulu.")
+        self.doctors = doctors.reset_index(drop=True)
+        self.rng = np.random.default_rng(seed)
+        self.days = days
+        self.today = np.datetime64(today or date.today(), "D")
+
+        # Nama pasien diambil dari pool (Faker hanya dipanggil sekali di awal)
+        fake = Faker('id_ID')
+        fake.seed_instance(seed)
+        self.names = np.array([fake.last_name().replace(" ", "").title() for _ in range(NAME_POOL_SIZE)])
+
+    def generate(self, n: int) -> pd.DataFrame:
+        rng = self.rng
+        doc = self.doctors.iloc[rng.integers(0, len(self.doctors), n)].reset_index(drop=True)
+
+        # Tanggal & status: hari ini (status acak) atau 1..days hari lalu (pasti selesai)
+        is_today = rng.random(n) < TODAY_RATE
+        days_ago = np.where(is_today, 0, rng.integers(1, self.days + 1, n))
+        visit_date = self.today - days_ago.astype("timedelta64[D]")
+        status = np.where(is_today, rng.choice(TODAY_STATUSES, n, p=TODAY_WEIGHTS), "Selesai")
+
+        # Waktu: check-in 07:00-14:59, masuk poli +10..60 menit, selesai +10..30 menit
+        chk_min = rng.integers(7, 15, n) * 60 + rng.integers(0, 60, n)
+        checkin = visit_date.astype("datetime64[m]") + chk_min.astype("timedelta64[m]")
+        entry = checkin + rng.integers(10, 61, n).astype("timedelta64[m]")
+        finish = entry + rng.integers(10, 31, n).astype("timedelta64[m]")
+        entered = status != "Menunggu"
+        done = status == "Selesai"
+
+        names = self.names[rng.integers(0, len(self.names), n)]
+        notes = pd.Series(NOTE_OPTIONS, dtype=object).iloc[rng.integers(0, len(NOTE_OPTIONS), n)].to_numpy()
+        return pd.DataFrame({
+            "username": np.char.add(np.char.lower(names), rng.integers(1, 1000, n).astype(str)),
+            "nama_pasien": names,
+            "poli": doc["poli"], "prefix_poli": doc["prefix"], "dokter": doc["dokter"],
+            "doctor_id_ref": doc["doctor_id"], "suffix": doc["suffix"],
+            "visit_date": pd.to_datetime(visit_date).date,
+            "checkin_time": pd.to_datetime(checkin),
+            "clinic_entry_time": pd.to_datetime(np.where(entered, entry, np.datetime64("NaT"))),
+            "completion_time": pd.to_datetime(np.where(done, finish, np.datetime64("NaT"))),
+            "status_pelayanan": status,
+            "catatan_medis": np.where(entered, np.char.add(notes.astype(str), " - Resep diberikan."), None),
+        })
+
+def assign_queue_numbers(df: pd.DataFrame, next_sequence) -> pd.DataFrame:
+    """Nomor urut per (dokter, tanggal). next_sequence(doctor_id, date, count) -> nomor pertama blok."""
+    df = df.sort_values(["visit_date", "doctor_id_ref", "checkin_time"], kind="stable").reset_index(drop=True)
+    offset = df.groupby(["doctor_id_ref", "visit_date"]).cumcount().to_numpy()
+    start = np.empty(len(df), dtype=np.int64)
+    for (doc_id, d), idx in df.groupby(["doctor_id_ref", "visit_date"]).indices.items():
+        start[idx] = next_sequence(int(doc_id), d, len(idx))
+    df["queue_sequence"] = start + offset
+    df["queue_number"] = df["prefix_poli"] + "-" + df["suffix"] + "-" + df["queue_sequence"].map("{:03d}".format)
+    return df
+
+def mark_members(df: pd.DataFrame, seen: set) -> pd.DataFrame:
+    """Kunjungan pertama username -> "Pasien Baru", berikutnya "Pasien Lama"."""
+    first = ~df["username"].duplicated() & ~df["username"].isin(seen)
+    df["status_member"] = np.where(first, "Pasien Baru", "Pasien Lama")
+    seen.update(df["username"])
+    return df
+
+def _py(v):
+    """Nilai pandas/NumPy -> tipe Python biasa untuk driver DB (NaT/NaN -> None)."""
+    if v is None or v is pd.NaT or (isinstance(v, float) and np.isnan(v)): return None
+    if isinstance(v, pd.Timestamp): return v.to_pydatetime()
+    if isinstance(v, np.generic): return v.item()
+    return v
+
+def _records(df: pd.DataFrame, cols) -> list:
+    return [{c: _py(v) for c, v in zip(cols, row)} for row in df[cols].itertuples(index=False)]
+
+def write_db(db, gen: VisitGenerator, total: int, chunk_size: int = CHUNK_SIZE) -> int:
+    pel_cols = [c.name for c in storage.TabelPelayanan.__table__.columns if c.name != "id"]
+    default_hash = security.get_password_hashes(["123"])[0]
+    seen_users = set()
+    next_seq = lambda doc_id, d, n: storage.allocate_queue_sequence(db, doc_id, d, count=n)
+
+    written = 0
+    while written < total:
+        df = gen.generate(min(chunk_size, total - written))
+        df = assign_queue_numbers(df, next_seq)
+
+        # Pasien baru + status member (cek ke DB sekali per chunk)
+        unames = df["username"].unique().tolist()
+        known = dict(db.query(storage.TabelUser.username, storage.TabelUser.total_visits).filter(storage.TabelUser.username.in_(unames)))
+        fresh = df.drop_duplicates("username")
+        fresh = fresh[~fresh["username"].isin(list(known))]
+        if len(fresh):
+            db.execute(insert(storage.TabelUser), [
+                {"username": u, "password": default_hash, "role": "pasien", "nama_lengkap": n}
+                for u, n in zip(fresh["username"], fresh["nama_pasien"])
+            ])
+        returning = {u for u, total in known.items() if total}
+        df = mark_members(df, seen_users | returning)
+
+        rows = _records(df, pel_cols)
+        last_id = gabungan_sync.last_pelayanan_id(db)
+        db.execute(insert(storage.TabelPelayanan), rows)
+        gabungan_sync.enqueue_since(db, last_id)
+        tickets = [SimpleNamespace(**r) for r in rows]
+        visit_counters.add_visits(db, tickets)
+        analytics.record_visits(db, tickets)
+        text_mining.record_notes(db, [(r["visit_date"], r["catatan_medis"]) for r in rows if r["catatan_medis"]])
+        cache.report_cache.bump(db) # Sebagian besar kunjungan bertanggal lampau
+        live_queue.touch(db, *{r["visit_date"] for r in rows}) # Antrean hari ini di server ikut dimuat ulang
+        db.commit()
+
+        seen_users.update(unames)
+        written += len(df)
+        print(f"📥 Generator: {written}/{total} baris")
+    return written
+
+def write_csv(path: str, gen: VisitGenerator, total: int, chunk_size: int = CHUNK_SIZE) -> int:
+    counters, seen_users = {}, set()
+
+    def next_seq(doc_id, d, n):
+        start = counters.get((doc_id, d), 0) + 1
+        counters[(doc_id, d)] = start + n - 1
+        return start
+
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        while written < total:
+            df = gen.generate(min(chunk_size, total - written))
+            df = mark_members(assign_queue_numbers(df, next_seq), seen_users)
+            df["visit_date"] = pd.to_datetime(df["visit_date"]).dt.strftime("%m/%d/%Y")
+            for c in ("checkin_time", "clinic_entry_time", "completion_time"):
+                df[c] = df[c].dt.strftime("%H:%M:%S").fillna("")
+            df[CSV_COLUMNS].to_csv(f, header=False, index=False)
+            written += len(df)
+            print(f"📝 Generator: {written}/{total} baris -> {path}")
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generator kunjungan sintetis (vektor NumPy).")
+    parser.add_argument("count", type=int, help="Jumlah kunjungan")
+    parser.add_argument("--seed", type=int, default=None, help="Seed agar dataset bisa diulang")
+    parser.add_argument("--days", type=int, default=30, help="Rentang hari ke belakang untuk data historis")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--csv", default=None, help="Tulis ke file CSV, bukan ke database")
+    args = parser.parse_args()
+
+    db = storage.SessionLocal()
+    try:
+        gen = VisitGenerator(load_doctors(db), seed=args.seed, days=args.days)
+        t0 = time_lib.perf_counter()
+        if args.csv:
+            n = write_csv(args.csv, gen, args.count, args.chunk_size)
+        else:
+            n = write_db(db, gen, args.count, args.chunk_size)
+            while gabungan_sync.worker.run_once(db): pass # Salin ke TabelGabungan
+        dt = time_lib.perf_counter() - t0
+        print(f"✅ {n} kunjungan dibuat dalam {dt:.1f} detik ({n / dt:,.0f} baris/detik).")
+        if not args.csv:
+            print("ℹ️ Server yang sedang jalan akan memuat ulang antrean hari ini saat pengecekan berkala.")
+    finally:
+        db.close()
@@ -203,6 +203,7 @@ else:
                     r = requests.post(f"{API_URL}/public/submit", json=payload, headers=headers)
                     if r.status_code == 200:
                         d = r.json()
+                        st.session_state.pop('history', None) # Riwayat dimuat ulang saat dibuka
                         st.balloons()
                         with st.container(border=True):
                             st.markdown("### 🎫 Tiket Antrean Berhasil Dibuat")
@@ -226,8 +227,23 @@ else:
     elif menu == MENU_RIWAYAT:
         st.header("📂 Tiket & Riwayat Saya")
         try:
-            r = requests.get(f"{API_URL}/public/my-history", headers=headers)
-            data = r.json()
+            # Riwayat per halaman (cursor dari server); halaman yang sudah dimuat disimpan di session
+            hist = st.session_state.get('history')
+            if st.button("🔄 Muat Ulang") or not hist or hist['token'] != st.session_state.token:
+                hist = {'token': st.session_state.token, 'items': [], 'cursor': None, 'done': False}
+                st.session_state.history = hist
+
+            def load_page():
+                params = {"limit": 20}
+                if hist['cursor']: params["cursor"] = hist['cursor']
+                page = requests.get(f"{API_URL}/public/my-history", params=params, headers=headers).json()
+                hist['items'] += page['items']
+                hist['cursor'] = page['next_cursor']
+                hist['done'] = page['next_cursor'] is None
+
+            if not hist['items'] and not hist['done']: load_page()
+
+            data = hist['items']
             if not data: st.info("Belum ada riwayat.")
             else:
                 for t in data:
@@ -243,6 +259,8 @@ else:
                             if t.get('catatan_medis'): st.info(f"Catatan: {t['catatan_medis']}")
                         with c3:
                             st.write(f"Status: **{t['status_pelayanan']}**")
+                if not hist['done'] and st.button("⬇️ Muat Lebih Banyak"):
+                    load_page(); st.rerun()
         except: st.error("Gagal load data.")
 
     # =================================================================
@@ -299,17 +317,17 @@ else:
     elif menu == MENU_DOKTER:
         st.header("👨‍⚕️ Ruang Periksa (Input Medis)")
         try:
-            res_docs = requests.get(f"{API_URL}/admin/doctors", headers=headers) 
-            doc_list = [d['dokter'] for d in res_docs.json()] if res_docs.status_code == 200 else []
-            if not doc_list: st.warning("Gagal memuat list dokter."); st.stop()
-            selected_doc = st.selectbox("Pilih Dokter Bertugas:", doc_list)
+            res_docs = requests.get(f"{API_URL}/ops/doctors", headers=headers) 
+            doc_map = {d['dokter']: d['doctor_id'] for d in res_docs.json()} if res_docs.status_code == 200 else {}
+            if not doc_map: st.warning("Gagal memuat list dokter."); st.stop()
+            selected_doc = st.selectbox("Pilih Dokter Bertugas:", list(doc_map))
         except: st.error("Koneksi Error"); st.stop()
 
         st.markdown("---")
         current_p = None
         try:
-            q_data = requests.get(f"{API_URL}/monitor/queue-board", headers=headers).json()
-            current_p = next((p for p in q_data if p['dokter'] == selected_doc and p['status_pelayanan'] == "Sedang Dilayani"), None)
+            # Satu tiket saja dari server (bukan seluruh papan antrean)
+            current_p = requests.get(f"{API_URL}/ops/active-patient", params={"doctor_id": doc_map[selected_doc]}, headers=headers).json().get('patient')
         except: pass
 
         if current_p:
@@ -318,9 +336,12 @@ else:
                 st.write(f"No: {current_p['queue_number']}")
                 catatan = st.text_area("Hasil Diagnosa / Resep:")
                 if st.button("✅ Simpan & Selesaikan", type="primary", use_container_width=True):
-                    requests.put(f"{API_URL}/ops/medical-notes/{current_p['queue_number']}", json={"catatan": catatan}, headers=headers)
-                    requests.post(f"{API_URL}/ops/scan-barcode", json={"barcode_data": current_p['queue_number'], "location": "finish"}, headers=headers)
-                    st.success("Tersimpan!"); time_lib.sleep(1); st.rerun()
+                    r = requests.post(f"{API_URL}/ops/finish-visit", json={"id": current_p['id'], "catatan": catatan}, headers=headers)
+                    res = r.json()
+                    if r.status_code == 200 and res.get('status') == "Success":
+                        st.success("Tersimpan!"); time_lib.sleep(1); st.rerun()
+                    else:
+                        st.error(res.get('message') or res.get('detail') or "Gagal menyimpan.")
         else:
             st.warning(f"Tidak ada pasien di ruangan {selected_doc}.")
             st.caption("Scan 'Masuk Poli' pada tiket pasien untuk memulai sesi.")
@@ -357,21 +378,25 @@ else:
 
         # --- 2. LOGIKA DATA & FILTERING ---
         try:
-            r = requests.get(f"{API_URL}/monitor/queue-board", headers=headers)
-            
-            if r.status_code == 200:
+            # Filter poli dikerjakan server; ETag -> 304 jika papan belum berubah
+            params = {} if target_poli == "SEMUA POLI" else {"poli": target_poli}
+            cached = st.session_state.get('tv_board', {}).get(target_poli)
+            req_headers = dict(headers)
+            if cached: req_headers["If-None-Match"] = cached['etag']
+            r = requests.get(f"{API_URL}/monitor/queue-board", params=params, headers=req_headers)
+
+            if r.status_code == 304:
+                raw_data = cached['data']
+            elif r.status_code == 200:
                 raw_data = r.json()
+                st.session_state.setdefault('tv_board', {})[target_poli] = {'etag': r.headers.get('ETag'), 'data': raw_data}
+            else:
+                raw_data = None
+
+            if raw_data is not None:
                 df = pd.DataFrame(raw_data)
 
                 if not df.empty:
-                    # Ambil kolom penting saja
-                    df = df[['queue_number', 'poli', 'dokter', 'status_pelayanan']]
-
-                    # *** INI LOGIKA FILTERNYA ***
-                    if target_poli != "SEMUA POLI":
-                        # Hanya ambil baris yang polinya sama dengan pilihan dropdown
-                        df = df[df['poli'] == target_poli]
-                    
                     # Cek lagi apakah setelah difilter datanya masih ada?
                     if not df.empty:
                         # Pisahkan Data: Yang Sedang Dilayani vs Menunggu
@@ -412,6 +437,8 @@ else:
                     
                     else:
                         st.info(f"Tidak ada antrean aktif untuk **{target_poli}** saat ini.")
+                elif target_poli != "SEMUA POLI":
+                    st.info(f"Tidak ada antrean aktif untuk **{target_poli}** saat ini.")
                 else:
                     st.info("Tidak ada antrean aktif di Rumah Sakit.")
             else:
@@ -784,11 +811,11 @@ else:
             st.subheader("7. Penambangan Teks Diagnosa (Word Cloud)")
             st.caption("Kata kunci penyakit yang paling sering muncul di catatan medis.")
             
-            text_data = d.get('text_mining', '')
-            if len(text_data) > 5:
+            term_freq = d.get('term_frequencies', {})
+            if term_freq:
                 try:
-                    # Buat WordCloud
-                    wc = WordCloud(width=1000, height=400, background_color='white', colormap='Reds').generate(text_data)
+                    # Buat WordCloud dari frekuensi kata (sudah dihitung di backend)
+                    wc = WordCloud(width=1000, height=400, background_color='white', colormap='Reds').generate_from_frequencies(term_freq)
                     
                     # Tampilkan pakai Matplotlib
                     fig_wc, ax = plt.subplots(figsize=(12, 4))
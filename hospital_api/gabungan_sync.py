@@ -0,0 +1,201 @@
+# FILE: gabungan_sync.py
+# TabelGabungan diisi secara asinkron dari TabelPelayanan lewat outbox.
+# Jalur request hanya menulis TabelPelayanan + 1 baris outbox (transaksi yang sama);
+# worker background mengambil outbox per batch lalu upsert TabelGabungan.
+# Aman dijalankan di banyak proses: baris outbox diklaim dengan FOR UPDATE SKIP LOCKED
+# dan tiket yang sama dikunci selama upsert (MySQL; SQLite memang hanya satu penulis).
+#
+#   python gabungan_sync.py            # proses outbox sampai habis
+#   python gabungan_sync.py --resync   # bangun ulang seluruh TabelGabungan
+import argparse
+import threading
+import time as time_lib
+from datetime import datetime
+
+from sqlalchemy import func, insert, update, delete, select, literal, exists, or_, DateTime
+
+import storage
+
+BATCH_SIZE = 500
+POLL_SECONDS = 2.0
+
+# --- DIPANGGIL DI JALUR TULIS (sebelum commit) ---
+
+def enqueue(db, *pelayanan_ids):
+    """Tandai tiket untuk disalin ke TabelGabungan setelah transaksi ini commit."""
+    if not pelayanan_ids: return
+    db.execute(insert(storage.TabelOutboxGabungan), [{"pelayanan_id": i} for i in pelayanan_ids])
+    storage.on_commit(db, worker.notify)
+
+def _enqueue_select(db, query):
+    """query = SELECT (pelayanan_id, created_at)."""
+    db.execute(insert(storage.TabelOutboxGabungan).from_select(["pelayanan_id", "created_at"], query))
+    storage.on_commit(db, worker.notify)
+
+def _now():
+    # Waktu dari aplikasi (UTC), sama dengan default kolom created_at
+    return literal(datetime.utcnow(), type_=DateTime)
+
+def last_pelayanan_id(db) -> int:
+    return db.query(func.max(storage.TabelPelayanan.id)).scalar() or 0
+
+def enqueue_since(db, last_id: int):
+    """Untuk INSERT massal (id tidak diketahui): antrekan semua tiket dengan id > last_id."""
+    t = storage.TabelPelayanan
+    _enqueue_select(db, select(t.id, _now()).where(t.id > last_id))
+
+def enqueue_doctor(db, doctor_id: int):
+    """Semua tiket dokter ini (mis. setelah ganti nama), tanpa menarik id ke aplikasi."""
+    t = storage.TabelPelayanan
+    _enqueue_select(db, select(t.id, _now()).where(t.doctor_id_ref == doctor_id))
+
+# --- MATERIALISASI ---
+
+def materialize(db, pelayanan_ids) -> int:
+    """Upsert baris TabelGabungan untuk tiket-tiket ini (hapus jika tiket sudah tidak ada)."""
+    P, G = storage.TabelPelayanan, storage.TabelGabungan
+    ids = set(pelayanan_ids)
+    # Kunci tiket (urut id, cegah deadlock): worker lain yang memegang tiket yang sama menunggu,
+    # lalu membaca baris Gabungan terbaru (locking read) sehingga tidak INSERT dobel
+    rows = db.query(P, storage.TabelDokter.doctor_code, storage.TabelPoli.prefix)\
+        .outerjoin(storage.TabelDokter, P.doctor_id_ref == storage.TabelDokter.doctor_id)\
+        .outerjoin(storage.TabelPoli, P.poli == storage.TabelPoli.poli)\
+        .filter(P.id.in_(ids)).order_by(P.id).with_for_update(of=P).all()
+    existing = dict(db.query(G.pelayanan_id, G.id).filter(G.pelayanan_id.in_(ids)).with_for_update().all())
+
+    inserts, updates = [], []
+    for t, doctor_code, prefix in rows:
+        values = {
+            "pelayanan_id": t.id, "username": t.username, "status_member": t.status_member,
+            "nama_pasien": t.nama_pasien, "poli": t.poli, "prefix_poli": prefix,
+            "dokter": t.dokter, "doctor_code": doctor_code, "doctor_id": t.doctor_id_ref,
+            "visit_date": t.visit_date, "checkin_time": t.checkin_time,
+            "clinic_entry_time": t.clinic_entry_time, "completion_time": t.completion_time,
+            "status_pelayanan": t.status_pelayanan, "queue_number": t.queue_number,
+            "queue_sequence": t.queue_sequence, "catatan_medis": t.catatan_medis,
+        }
+        if t.id in existing: updates.append({"id": existing[t.id], **values})
+        else: inserts.append(values)
+
+    if inserts: db.execute(insert(G), inserts)
+    if updates: db.execute(update(G), updates) # Bulk UPDATE by primary key
+    gone = ids - {t.id for t, _, _ in rows}
+    if gone: db.execute(delete(G).where(G.pelayanan_id.in_(gone)))
+    db.expunge_all() # Objek tiket tidak dipakai lagi, jangan ditahan session
+    return len(rows)
+
+def claim(db, limit: int):
+    """Baris outbox tertua yang belum dipegang proses lain (dikunci sampai commit)."""
+    O = storage.TabelOutboxGabungan
+    return db.query(O.id, O.pelayanan_id).order_by(O.id).limit(limit).with_for_update(skip_locked=True)
+
+class OutboxWorker:
+    def __init__(self, batch_size: int = BATCH_SIZE, poll_seconds: float = POLL_SECONDS):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.processed = self.batches = self.errors = 0
+        self.last_error = None
+        self.last_batch_at = None
+
+    def notify(self):
+        self._wake.set()
+
+    def start(self):
+        if self._thread and self._thread.is_alive(): return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="gabungan-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set(); self._wake.set()
+        if self._thread: self._thread.join(timeout=self.poll_seconds + 5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                while not self._stop.is_set() and self.run_once() == self.batch_size:
+                    pass # Masih ada sisa -> lanjut batch berikutnya tanpa menunggu
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{datetime.now():%H:%M:%S} {e}"
+                print(f"⚠️ Outbox Gabungan gagal: {e}")
+
+    def run_once(self, db=None) -> int:
+        """Proses satu batch outbox. Return jumlah baris outbox yang diambil."""
+        own = db is None
+        db = db or storage.SessionLocal()
+        try:
+            O = storage.TabelOutboxGabungan
+            batch = claim(db, self.batch_size).all()
+            if not batch: return 0
+            materialize(db, {pid for _, pid in batch})
+            db.execute(delete(O).where(O.id.in_([i for i, _ in batch])))
+            db.commit()
+            self.processed += len(batch)
+            self.batches += 1
+            self.last_batch_at = datetime.now()
+            return len(batch)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if own: db.close()
+
+    def stats(self, db) -> dict:
+        O = storage.TabelOutboxGabungan
+        pending, oldest = db.query(func.count(O.id), func.min(O.created_at)).one()
+        return {
+            "pending": pending,
+            "lag_seconds": round((datetime.utcnow() - oldest).total_seconds(), 1) if oldest else 0.0,
+            "processed": self.processed, "batches": self.batches, "errors": self.errors,
+            "last_error": self.last_error,
+            "last_batch_at": self.last_batch_at.isoformat() if self.last_batch_at else None,
+            "running": bool(self._thread and self._thread.is_alive()),
+        }
+
+worker = OutboxWorker()
+
+def resync(db, chunk_size: int = 5000) -> int:
+    """Bangun ulang seluruh TabelGabungan dari TabelPelayanan (perbaikan drift / migrasi).
+    Upsert di tempat per chunk (pembaca tidak pernah melihat tabel kosong), lalu hapus
+    baris yang tiketnya sudah tidak ada."""
+    O, P, G = storage.TabelOutboxGabungan, storage.TabelPelayanan, storage.TabelGabungan
+    # Outbox sampai titik ini ikut tercakup resync; yang masuk belakangan tetap diproses worker
+    last_outbox = db.query(func.max(O.id)).scalar() or 0
+
+    done, last_id = 0, 0
+    while True:
+        ids = [i for (i,) in db.query(P.id).filter(P.id > last_id).order_by(P.id).limit(chunk_size)]
+        if not ids: break
+        done += materialize(db, ids)
+        db.commit()
+        last_id = ids[-1]
+        print(f"🔄 Resync Gabungan: {done} baris")
+
+    orphan = or_(G.pelayanan_id.is_(None), ~exists().where(P.id == G.pelayanan_id))
+    removed = db.execute(delete(G).where(orphan).execution_options(synchronize_session=False)).rowcount
+    if removed: print(f"🧹 Resync Gabungan: {removed} baris tanpa tiket dihapus")
+    db.execute(delete(O).where(O.id <= last_outbox))
+    db.commit()
+    return done
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sinkronisasi TabelGabungan dari outbox.")
+    parser.add_argument("--resync", action="store_true", help="Bangun ulang seluruh TabelGabungan")
+    args = parser.parse_args()
+
+    db = storage.SessionLocal()
+    try:
+        if args.resync:
+            print(f"✅ TabelGabungan dibangun ulang: {resync(db)} baris.")
+        else:
+            t0, n = time_lib.perf_counter(), 0
+            while (k := worker.run_once(db)): n += k
+            print(f"✅ Outbox diproses: {n} baris dalam {time_lib.perf_counter() - t0:.1f} detik.")
+    finally:
+        db.close()
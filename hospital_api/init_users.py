@@ -1,4 +1,4 @@
-from storage import SessionLocal, TabelUser
+from storage import SessionLocal, TabelUser, revoke_user_tokens
 import security
 
 def init_users_final():
@@ -17,25 +17,32 @@ def init_users_final():
             {"username": "admin_depan", "nama": "Petugas Administrasi", "role": "administrasi"},
         ]
         
+        existing = {u.username: u for u in db.query(TabelUser).filter(TabelUser.username.in_([s['username'] for s in staff_list]))}
+        # Akun baru di-hash sekaligus (paralel), tiap akun tetap punya salt sendiri
+        baru = [s for s in staff_list if s['username'] not in existing]
+        hashes = security.get_password_hashes(["123"] * len(baru), per_user=True)
+        
+        for staff, hashed in zip(baru, hashes):
+            new_user = TabelUser(
+                username=staff['username'],
+                password=hashed,
+                role=staff['role'],
+                nama_lengkap=staff['nama']
+            )
+            db.add(new_user)
+            print(f"✅ Akun dibuat: {staff['username']} ({staff['role']})")
+
         for staff in staff_list:
-            cek = db.query(TabelUser).filter(TabelUser.username == staff['username']).first()
-            if not cek:
-                new_user = TabelUser(
-                    username=staff['username'],
-                    password=security.get_password_hash("123"),
-                    role=staff['role'],
-                    nama_lengkap=staff['nama']
-                )
-                db.add(new_user)
-                print(f"✅ Akun dibuat: {staff['username']} ({staff['role']})")
+            cek = existing.get(staff['username'])
+            if not cek: continue
+            # Update role jika beda (agar sesuai request terbaru Anda)
+            if cek.role != staff['role']:
+                cek.role = staff['role']
+                # Token lama masih membawa role lama -> tolak di server (juga yang sudah di-cache)
+                revoke_user_tokens(db, cek.username)
+                print(f"🔄 Role diupdate: {staff['username']} -> {staff['role']}")
             else:
-                # Update role jika beda (agar sesuai request terbaru Anda)
-                if cek.role != staff['role']:
-                    cek.role = staff['role']
-                    db.commit()
-                    print(f"🔄 Role diupdate: {staff['username']} -> {staff['role']}")
-                else:
-                    print(f"ℹ️ Akun sudah ada: {staff['username']}")
+                print(f"ℹ️ Akun sudah ada: {staff['username']}")
 
         db.commit()
         print("Selesai. Password default: 123")
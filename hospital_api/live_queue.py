@@ -0,0 +1,206 @@
+# FILE: live_queue.py
+# State antrean HARI INI di memori proses (per poli & per dokter).
+# Dimuat dari TabelPelayanan saat startup, di-update write-through oleh endpoint,
+# dan dicek berkala terhadap database (rebuild otomatis jika berbeda).
+# Antar worker: setiap tulisan tiket hari ini menaikkan stempel queue_version di
+# tabel_meta; worker yang stempelnya tertinggal memuat ulang sebelum melayani.
+import os
+import threading
+import time as time_lib
+from datetime import date, datetime
+
+import storage
+
+COLUMNS = (
+    "id", "username", "nama_pasien", "poli", "dokter", "doctor_id_ref", "visit_date",
+    "checkin_time", "clinic_entry_time", "completion_time", "status_pelayanan",
+    "queue_number", "queue_sequence", "catatan_medis", "status_member",
+)
+BOARD_STATUSES = ("Menunggu", "Sedang Dilayani")
+QUEUE_META_KEY = "queue_version"
+STAMP_CHECK_SECONDS = float(os.getenv("LIVE_QUEUE_STAMP_CHECK", "1"))
+
+class LiveTicket:
+    __slots__ = COLUMNS
+
+    def __init__(self, **values):
+        for c in COLUMNS: setattr(self, c, values.get(c))
+
+    def as_dict(self) -> dict:
+        return {c: getattr(self, c) for c in COLUMNS}
+
+def _same(a: LiveTicket, b: LiveTicket) -> bool:
+    """Bandingkan dua tiket; selisih waktu < 1 detik diabaikan (DATETIME MySQL tanpa mikrodetik)."""
+    for c in COLUMNS:
+        x, y = getattr(a, c), getattr(b, c)
+        if isinstance(x, datetime) and isinstance(y, datetime):
+            if abs((x - y).total_seconds()) >= 1: return False
+        elif x != y:
+            return False
+    return True
+
+def snapshot(t) -> LiveTicket:
+    """Salin kolom tiket ORM (panggil sebelum commit agar tidak memicu refresh)."""
+    return LiveTicket(**{c: getattr(t, c) for c in COLUMNS})
+
+def touch(db, *dates):
+    """Panggil di transaksi yang menulis tiket. Jika ada tiket hari ini, naikkan stempel
+    queue_version (ikut transaksi) dan kembalikan nilai barunya untuk `LiveQueue.apply`."""
+    if date.today() not in dates: return None
+    storage.bump_meta(db, QUEUE_META_KEY)
+    return storage.get_meta(db, QUEUE_META_KEY)
+
+class LiveQueue:
+    def __init__(self, check_seconds: float = STAMP_CHECK_SECONDS):
+        self._lock = threading.RLock()
+        self.day = None
+        self.stale = True
+        self.version = 0 # Naik setiap ada perubahan tiket hari ini
+        self.stamp = None # queue_version database yang sudah tercermin di memori
+        self.check_seconds = check_seconds
+        self._checked_at = 0.0
+        self.tickets = {} # id -> LiveTicket
+        self.by_poli = {} # poli -> set(id)
+        self.by_doctor = {} # doctor_id -> set(id)
+        self.rebuilds = 0
+        self.listeners = [] # fn(changes): [(tiket_lama, tiket_baru)], None = muat ulang total
+
+    # --- LOAD & WRITE-THROUGH ---
+    def _load_rows(self, db) -> dict:
+        rows = db.query(storage.TabelPelayanan).filter(storage.TabelPelayanan.visit_date == date.today()).all()
+        return {t.id: snapshot(t) for t in rows}
+
+    def _index(self, tickets: dict):
+        self.tickets, self.by_poli, self.by_doctor = tickets, {}, {}
+        for t in tickets.values():
+            self.by_poli.setdefault(t.poli, set()).add(t.id)
+            self.by_doctor.setdefault(t.doctor_id_ref, set()).add(t.id)
+
+    def _notify(self, changes):
+        for fn in self.listeners:
+            try: fn(changes)
+            except Exception as e: print(f"⚠️ Listener live queue gagal: {e}")
+
+    def _replace(self, fresh: dict, stamp: int, diff=None):
+        """Ganti isi memori dengan hasil muat ulang; kirim selisihnya ke listener."""
+        if self.stale or self.day != date.today():
+            changes = None # Isi lama tidak bisa dipercaya (import massal / ganti hari)
+        else:
+            if diff is None:
+                diff = {i for i in set(fresh) | set(self.tickets)
+                        if i not in fresh or i not in self.tickets or not _same(fresh[i], self.tickets[i])}
+            changes = [(self.tickets.get(i), fresh.get(i)) for i in sorted(diff)]
+        self._index(fresh)
+        self.day, self.stale = date.today(), False
+        self.stamp, self._checked_at = stamp, time_lib.monotonic()
+        self.version += 1
+        self.rebuilds += 1
+        if changes is None or changes: self._notify(changes)
+
+    def load(self, db):
+        # Stempel dibaca sebelum baris: tulisan di antaranya paling buruk memicu muat ulang lagi
+        stamp = storage.get_meta(db, QUEUE_META_KEY)
+        fresh = self._load_rows(db)
+        with self._lock:
+            self._replace(fresh, stamp)
+
+    def _ensure(self, db):
+        if self.stale or self.day != date.today():
+            self.load(db)
+        elif time_lib.monotonic() - self._checked_at >= self.check_seconds:
+            # Worker lain menulis tiket hari ini sejak pengecekan terakhir?
+            self._checked_at = time_lib.monotonic()
+            if storage.get_meta(db, QUEUE_META_KEY) != self.stamp: self.load(db)
+
+    def mark_stale(self):
+        """Paksa muat ulang pada query berikutnya (mis. setelah import massal)."""
+        with self._lock:
+            self.stale = True
+            self.version += 1
+
+    def apply(self, t, stamp=None):
+        """Simpan versi terbaru satu tiket (LiveTicket hasil snapshot atau objek ORM).
+        `stamp` = hasil `touch` di transaksi yang sama; jika tepat satu di atas stempel
+        memori, tidak ada tulisan worker lain yang terlewat sehingga tidak perlu muat ulang."""
+        if not isinstance(t, LiveTicket): t = snapshot(t)
+        with self._lock:
+            if stamp is not None and self.stamp is not None and stamp == self.stamp + 1: self.stamp = stamp
+            else: self._checked_at = 0.0 # Ada tulisan lain di antaranya -> cek stempel pada query berikutnya
+            if t.visit_date != self.day: return
+            old = self.tickets.get(t.id)
+            if old and _same(old, t): return # Sudah tercermin (mis. lewat muat ulang)
+            if old and old.poli != t.poli: self.by_poli.get(old.poli, set()).discard(t.id)
+            if old and old.doctor_id_ref != t.doctor_id_ref: self.by_doctor.get(old.doctor_id_ref, set()).discard(t.id)
+            self.tickets[t.id] = t
+            self.by_poli.setdefault(t.poli, set()).add(t.id)
+            self.by_doctor.setdefault(t.doctor_id_ref, set()).add(t.id)
+            self.version += 1
+            self._notify([(old, t)])
+
+    def refresh(self, db):
+        """Cek stempel sekarang (dipanggil berkala selama ada client SSE)."""
+        with self._lock:
+            self._ensure(db)
+
+    # --- QUERY ---
+    def current_version(self, db) -> str:
+        """Tanggal + stempel queue_version yang tercermin di memori (muat ulang dulu jika basi).
+        Sama di semua worker untuk isi yang sama -> dipakai sebagai ETag papan antrean."""
+        with self._lock:
+            self._ensure(db)
+            return f"{self.day}-{self.stamp}"
+
+    def board(self, db, poli=None, doctor_id=None) -> list:
+        """Tiket yang sedang menunggu / dilayani, urut id (sama seperti query DB lama)."""
+        with self._lock:
+            self._ensure(db)
+            ids = self.tickets.keys()
+            if poli is not None: ids = self.by_poli.get(poli, set())
+            if doctor_id is not None: ids = set(ids) & self.by_doctor.get(doctor_id, set())
+            return [self.tickets[i] for i in sorted(ids) if self.tickets[i].status_pelayanan in BOARD_STATUSES]
+
+    def active_patient(self, db, doctor_id: int):
+        with self._lock:
+            self._ensure(db)
+            active = [self.tickets[i] for i in self.by_doctor.get(doctor_id, ())
+                      if self.tickets[i].status_pelayanan == "Sedang Dilayani"]
+            return max(active, key=lambda t: t.id) if active else None
+
+    def position(self, db, queue_number: str):
+        """Posisi tiket di antrean dokternya: jumlah pasien 'Menunggu' di depannya."""
+        with self._lock:
+            self._ensure(db)
+            t = next((x for x in self.tickets.values() if x.queue_number == queue_number), None)
+            if not t: return None
+            same_doc = [self.tickets[i] for i in self.by_doctor.get(t.doctor_id_ref, ())]
+            ahead = sum(1 for x in same_doc if x.status_pelayanan == "Menunggu" and x.queue_sequence < t.queue_sequence)
+            serving = self.active_patient(db, t.doctor_id_ref)
+            return {
+                "queue_number": t.queue_number, "status_pelayanan": t.status_pelayanan,
+                "poli": t.poli, "dokter": t.dokter, "ahead": ahead,
+                "now_serving": serving.queue_number if serving else None,
+            }
+
+    # --- KONSISTENSI ---
+    def verify(self, db) -> dict:
+        """Bandingkan state memori dengan database; rebuild jika ada selisih."""
+        v0 = self.version
+        stamp = storage.get_meta(db, QUEUE_META_KEY)
+        fresh = self._load_rows(db)
+        with self._lock:
+            if self.version != v0:
+                # Ada tulisan masuk selama load -> data `fresh` bisa lebih tua, cek di putaran berikutnya
+                return {"tickets": len(self.tickets), "mismatched": 0, "rebuilt": False,
+                        "version": self.version, "rebuilds": self.rebuilds}
+            if self.day != date.today():
+                diff = set(fresh)
+            else:
+                diff = {i for i in set(fresh) | set(self.tickets)
+                        if i not in fresh or i not in self.tickets
+                        or not _same(fresh[i], self.tickets[i])}
+            if diff or self.stale: self._replace(fresh, stamp, diff)
+            else: self.stamp = stamp
+            return {"tickets": len(self.tickets), "mismatched": len(diff), "rebuilt": bool(diff),
+                    "version": self.version, "rebuilds": self.rebuilds}
+
+engine = LiveQueue()
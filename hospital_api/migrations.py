@@ -0,0 +1,152 @@
+# FILE: migrations.py
+# Migrasi skema untuk database yang sudah ada (create_all tidak menambah index ke tabel lama)
+from sqlalchemy import inspect, func, select, text
+from sqlalchemy.orm import Session
+
+import storage
+import analytics
+import text_mining
+import gabungan_sync
+import visit_counters
+
+def _index(model, name):
+    return next(ix for ix in model.__table__.indexes if ix.name == name)
+
+def _create_missing_indexes(conn, model, names):
+    existing = {ix['name'] for ix in inspect(conn).get_indexes(model.__tablename__)}
+    for name in names:
+        if name in existing: continue
+        _index(model, name).create(bind=conn)
+        print(f"✅ Index dibuat: {name}")
+    return True
+
+def m001_hot_query_indexes(conn):
+    """Index gabungan untuk pola filter yang sering dipakai di main.py."""
+    return _create_missing_indexes(conn, storage.TabelPelayanan, [
+        "ix_pelayanan_dokter_tanggal", "ix_pelayanan_tanggal_status", "ix_pelayanan_nomor",
+    ])
+
+def m002_unique_queue_number(conn):
+    """Nomor antrean unik per tanggal. Ditunda jika masih ada data duplikat."""
+    t = storage.TabelPelayanan
+    dup = conn.execute(
+        select(t.visit_date, t.queue_number, func.count())
+        .group_by(t.visit_date, t.queue_number)
+        .having(func.count() > 1)
+    ).all()
+    if dup:
+        print(f"⚠️ Migrasi ditunda: {len(dup)} nomor antrean duplikat, contoh {dup[0][1]} ({dup[0][0]}).")
+        return False
+    return _create_missing_indexes(conn, t, ["uq_pelayanan_tanggal_nomor"])
+
+def m003_rollup_backfill(conn):
+    """Isi tabel rollup analitik dari data kunjungan yang sudah ada."""
+    with Session(bind=conn) as db:
+        if db.query(storage.TabelPelayanan.id).first() and not db.query(storage.TabelRollupHarian.hour).first():
+            print(f"✅ Rollup analitik diisi: {analytics.rebuild_rollups(db)} baris.")
+    return True
+
+def m004_term_backfill(conn):
+    """Isi frekuensi kata dari catatan medis yang sudah ada."""
+    with Session(bind=conn) as db:
+        if db.query(storage.TabelPelayanan.id).filter(storage.TabelPelayanan.catatan_medis.isnot(None)).first() \
+                and not db.query(storage.TabelTermHarian.term).first():
+            print(f"✅ Frekuensi kata diisi: {text_mining.rebuild_term_frequencies(db)} baris.")
+    return True
+
+def m005_gabungan_outbox(conn):
+    """Kolom pelayanan_id di TabelGabungan (kunci upsert worker outbox) + isi ulang dari TabelPelayanan."""
+    t = storage.TabelGabungan
+    cols = {c['name'] for c in inspect(conn).get_columns(t.__tablename__)}
+    if "pelayanan_id" not in cols:
+        conn.execute(text(f"ALTER TABLE {t.__tablename__} ADD COLUMN pelayanan_id INTEGER NULL"))
+        print("✅ Kolom dibuat: tabel_gabungan_transaksi.pelayanan_id")
+    # Baris lama belum punya pelayanan_id -> salin ulang semuanya dari tabel utama
+    with Session(bind=conn) as db:
+        if db.query(t.id).filter(t.pelayanan_id.is_(None)).first() or \
+                (db.query(storage.TabelPelayanan.id).first() and not db.query(t.id).first()):
+            print(f"✅ TabelGabungan diisi ulang: {gabungan_sync.resync(db)} baris.")
+    return _create_missing_indexes(conn, t, ["uq_gabungan_pelayanan"])
+
+def m006_active_patient_index(conn):
+    """Index untuk /ops/active-patient (pasien 'Sedang Dilayani' per dokter hari ini)."""
+    return _create_missing_indexes(conn, storage.TabelPelayanan, ["ix_pelayanan_dokter_tanggal_status"])
+
+def m007_user_visit_counters(conn):
+    """Kolom counter kunjungan di TabelUser + isi dari riwayat yang sudah ada."""
+    t = storage.TabelUser
+    cols = {c['name'] for c in inspect(conn).get_columns(t.__tablename__)}
+    for col in ("total_visits", "completed_visits"):
+        if col not in cols:
+            conn.execute(text(f"ALTER TABLE {t.__tablename__} ADD COLUMN {col} INTEGER NOT NULL DEFAULT 0"))
+            print(f"✅ Kolom dibuat: {t.__tablename__}.{col}")
+    with Session(bind=conn) as db:
+        if db.query(storage.TabelPelayanan.id).first():
+            print(f"✅ Counter kunjungan diisi: {len(visit_counters.recount(db))} user.")
+    return True
+
+def m008_history_keyset_index(conn):
+    """Index (username, visit_date, id) untuk /public/my-history; menggantikan ix_pelayanan_user_tanggal."""
+    t = storage.TabelPelayanan
+    _create_missing_indexes(conn, t, ["ix_pelayanan_user_tanggal_id"])
+    existing = {ix['name'] for ix in inspect(conn).get_indexes(t.__tablename__)}
+    if "ix_pelayanan_user_tanggal" in existing:
+        # Awalan index baru sama persis -> index lama hanya menambah biaya tulis
+        on = f" ON {t.__tablename__}" if conn.dialect.name == "mysql" else ""
+        conn.execute(text(f"DROP INDEX ix_pelayanan_user_tanggal{on}"))
+        print("✅ Index dihapus: ix_pelayanan_user_tanggal")
+    return True
+
+def m009_drop_gabungan_nomor_index(conn):
+    """TabelGabungan hanya dibaca laporan & dicari per pelayanan_id -> index nomor antrean hanya beban tulis."""
+    t = storage.TabelGabungan
+    existing = {ix['name'] for ix in inspect(conn).get_indexes(t.__tablename__)}
+    if "ix_gabungan_nomor_tanggal" in existing:
+        on = f" ON {t.__tablename__}" if conn.dialect.name == "mysql" else ""
+        conn.execute(text(f"DROP INDEX ix_gabungan_nomor_tanggal{on}"))
+        print("✅ Index dihapus: ix_gabungan_nomor_tanggal")
+    return True
+
+def m010_token_version(conn):
+    """Revokasi token per versi (klaim "tv"), bukan perbandingan waktu per detik."""
+    t = storage.TabelTokenRevocation
+    cols = {c['name'] for c in inspect(conn).get_columns(t.__tablename__)}
+    if "token_version" not in cols:
+        conn.execute(text(f"ALTER TABLE {t.__tablename__} ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0"))
+        # User yang sudah direvokasi: token lama (tanpa tv = versi 0) tetap ditolak
+        conn.execute(text(f"UPDATE {t.__tablename__} SET token_version = 1"))
+        print(f"✅ Kolom dibuat: {t.__tablename__}.token_version")
+    return True
+
+# Urutan penting: migrasi baru selalu ditambahkan di paling bawah
+MIGRATIONS = [
+    ("001_hot_query_indexes", m001_hot_query_indexes),
+    ("002_unique_queue_number", m002_unique_queue_number),
+    ("003_rollup_backfill", m003_rollup_backfill),
+    ("004_term_backfill", m004_term_backfill),
+    ("005_gabungan_outbox", m005_gabungan_outbox),
+    ("006_active_patient_index", m006_active_patient_index),
+    ("007_user_visit_counters", m007_user_visit_counters),
+    ("008_history_keyset_index", m008_history_keyset_index),
+    ("009_drop_gabungan_nomor_index", m009_drop_gabungan_nomor_index),
+    ("010_token_version", m010_token_version),
+]
+
+def run_migrations(engine=None):
+    engine = engine or storage.engine
+    # Tabel baru dibuat dulu; migrasi hanya mengurus perubahan pada tabel lama
+    storage.Base.metadata.create_all(bind=engine)
+    t = storage.TabelSchemaMigration
+
+    with engine.connect() as conn:
+        done = set(conn.execute(select(t.version)).scalars())
+
+    for version, fn in MIGRATIONS:
+        if version in done: continue
+        with engine.begin() as conn:
+            if fn(conn):
+                conn.execute(t.__table__.insert().values(version=version))
+                print(f"🔧 Migrasi diterapkan: {version}")
+
+if __name__ == "__main__":
+    run_migrations()
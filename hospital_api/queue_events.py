@@ -0,0 +1,90 @@
+# FILE: queue_events.py
+# Broker event papan antrean untuk stream SSE /monitor/queue-stream.
+# Delta berasal dari perubahan state live_queue: tulisan di worker ini (write-through) maupun
+# di worker lain (muat ulang karena stempel queue_version berubah). Subscriber async menerima
+# lewat buffer terbatas.
+import asyncio
+import threading
+
+import live_queue
+from live_queue import BOARD_STATUSES
+
+BUFFER_SIZE = 100 # Maks event tertunda per client sebelum dipaksa resync
+
+def ticket_view(t) -> dict:
+    """Kolom yang ditampilkan di layar TV saja (tanpa nama pasien / catatan medis)."""
+    return {
+        "id": t.id, "queue_number": t.queue_number, "poli": t.poli,
+        "dokter": t.dokter, "status_pelayanan": t.status_pelayanan,
+    }
+
+def change_event(old, new):
+    """Terjemahkan perubahan satu tiket (versi lama/baru, None = tidak ada) menjadi delta papan:
+    added / status / removed. Perubahan yang tidak terlihat di papan -> None."""
+    was = old is not None and old.status_pelayanan in BOARD_STATUSES
+    now = new is not None and new.status_pelayanan in BOARD_STATUSES
+    if now and not was: kind = "added"
+    elif now and was:
+        if ticket_view(old) == ticket_view(new): return None
+        kind = "status"
+    elif was and not now: kind = "removed"
+    else: return None
+    return {"type": kind, "ticket": ticket_view(new if now else old)}
+
+class Subscriber:
+    def __init__(self, loop, poli=None):
+        self.loop = loop
+        self.poli = poli
+        self.queue = asyncio.Queue(maxsize=BUFFER_SIZE)
+
+class QueueBroker:
+    def __init__(self):
+        self._subs = set()
+        self._lock = threading.Lock()
+        self.resyncs = 0
+
+    def subscribe(self, poli=None) -> Subscriber:
+        sub = Subscriber(asyncio.get_running_loop(), poli)
+        with self._lock: self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock: self._subs.discard(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subs)
+
+    def publish(self, event):
+        """Aman dipanggil dari thread mana pun (mis. setelah commit di endpoint sync)."""
+        if not event: return
+        with self._lock: subs = list(self._subs)
+        for sub in subs:
+            if sub.poli and sub.poli != event["ticket"]["poli"]: continue
+            try: sub.loop.call_soon_threadsafe(self._offer, sub, event)
+            except RuntimeError: self.unsubscribe(sub) # Event loop client sudah tutup
+
+    def publish_changes(self, changes):
+        """Listener live_queue: None / terlalu banyak perubahan -> client memuat ulang snapshot."""
+        if not self._subs: return
+        if changes is None or len(changes) > BUFFER_SIZE: return self.resync_all()
+        for old, new in changes: self.publish(change_event(old, new))
+
+    def resync_all(self):
+        """Minta semua client memuat ulang snapshot (mis. setelah import massal)."""
+        with self._lock: subs = list(self._subs)
+        for sub in subs:
+            try: sub.loop.call_soon_threadsafe(self._offer, sub, {"type": "resync"})
+            except RuntimeError: self.unsubscribe(sub)
+
+    def _offer(self, sub, event):
+        try:
+            sub.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Client terlalu lambat: buang buffer, minta kirim ulang snapshot
+            while not sub.queue.empty(): sub.queue.get_nowait()
+            sub.queue.put_nowait({"type": "resync"})
+            self.resyncs += 1
+
+broker = QueueBroker()
+live_queue.engine.listeners.append(broker.publish_changes)
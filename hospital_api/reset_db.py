@@ -1,9 +1,19 @@
 from storage import engine, Base
 from sqlalchemy import text
+import migrations
 
 def reset():
     print("Menghapus database lama...")
     with engine.connect() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS tabel_schema_migrations"))
+        conn.execute(text("DROP TABLE IF EXISTS tabel_antrean_counter"))
+        conn.execute(text("DROP TABLE IF EXISTS tabel_rollup_harian"))
+        conn.execute(text("DROP TABLE IF EXISTS tabel_term_harian"))
+        conn.execute(text("DROP TABLE IF EXISTS tabel_outbox_gabungan"))
+        conn.execute(text("DROP TABLE IF EXISTS tabel_meta"))
+        conn.execute(text("DROP TABLE IF EXISTS tabel_token_revocation"))
+        conn.execute(text("DROP TABLE IF EXISTS tabel_gabungan_arsip"))
+        conn.execute(text("DROP TABLE IF EXISTS tabel_pelayanan_arsip"))
         conn.execute(text("DROP TABLE IF EXISTS tabel_gabungan_transaksi"))
         conn.execute(text("DROP TABLE IF EXISTS tabel_pelayanan_normal"))
         conn.execute(text("DROP TABLE IF EXISTS tabel_dokter_normal"))
@@ -14,6 +24,7 @@ def reset():
     
     print("Membuat database baru...")
     Base.metadata.create_all(bind=engine)
+    migrations.run_migrations(engine)
     print("Selesai! Database baru siap digunakan.")
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
-from typing import Optional, Literal
+from typing import List, Optional, Literal
 from datetime import date, datetime, time
 
 # --- HELPER FUNCTIONS ---
@@ -125,6 +125,24 @@ class ScanRequest(BaseModel):
     location: str = Field(..., pattern="^(arrival|clinic|finish)$")
     model_config = ConfigDict(json_schema_extra={"example": {"barcode_data": "MATA-001-001", "location": "arrival"}})
 
+# [BARU] Scan yang di-buffer kiosk saat offline, dikirim ulang berurutan
+class ScanBatchItem(ScanRequest):
+    scanned_at: Optional[datetime] = Field(default=None, description="Waktu scan di kiosk (default: waktu server)")
+
+    @field_validator('scanned_at')
+    def to_local_naive(cls, v):
+        # Kolom DateTime di DB tanpa timezone -> simpan sebagai waktu lokal server
+        if v is not None and v.tzinfo is not None:
+            v = v.astimezone().replace(tzinfo=None)
+        return v
+
+class ScanBatchRequest(BaseModel):
+    scans: List[ScanBatchItem] = Field(..., min_length=1, max_length=500)
+    model_config = ConfigDict(json_schema_extra={"example": {"scans": [
+        {"barcode_data": "MATA-001-001", "location": "arrival", "scanned_at": "2025-01-01T08:15:00"},
+        {"barcode_data": "MATA-001-002", "location": "arrival", "scanned_at": "2025-01-01T08:17:30"},
+    ]}})
+
 class MedicalNoteUpdate(BaseModel):
     catatan: str = Field(..., min_length=3, description="Hasil diagnosa atau catatan dokter")
 
@@ -137,6 +155,13 @@ class MedicalNoteUpdate(BaseModel):
         }
     )
 
+# [BARU] Simpan catatan + selesaikan pasien dalam satu request (Ruang Periksa)
+class FinishVisitRequest(MedicalNoteUpdate):
+    id: int = Field(..., ge=1, description="ID tiket (nomor antrean bisa sama di tanggal lain)")
+    model_config = ConfigDict(json_schema_extra={"example": {
+        "id": 1, "catatan": "Pasien mengalami flu ringan. Diberikan resep Paracetamol 3x1."
+    }})
+
 class PoliSchema(BaseModel):
     poli: str; prefix: str
     model_config = ConfigDict(from_attributes=True)
@@ -161,6 +186,11 @@ class PelayananSchema(BaseModel):
     catatan_medis: Optional[str] = None 
     model_config = ConfigDict(from_attributes=True)
 
+# [BARU] Satu halaman riwayat (keyset): kirim balik next_cursor untuk halaman berikutnya
+class HistoryPage(BaseModel):
+    items: List[PelayananSchema]
+    next_cursor: Optional[str] = None
+
 class ClinicStats(BaseModel):
     poli_name: str; total_doctors: int; total_patients_today: int
     patients_waiting: int; patients_being_served: int; patients_finished: int
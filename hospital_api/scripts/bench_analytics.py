@@ -0,0 +1,168 @@
+# FILE: scripts/bench_analytics.py
+# Benchmark /analytics/comprehensive-report pada N kunjungan sintetis (database SQLite terpisah):
+#   legacy : semua baris TabelPelayanan -> objek ORM -> DataFrame pandas (jalur sebelum agregasi SQL)
+#   sql    : analytics.aggregate_visits (GROUP BY di database)
+#   rollup : analytics.aggregate_rollups (jalur endpoint saat ini)
+# Hasil ketiganya dibandingkan (kecuali field teks catatan yang formatnya memang berubah).
+#
+#   python scripts/bench_analytics.py                      # 1.000.000 baris
+#   python scripts/bench_analytics.py --rows 200000 --skip-legacy
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time as time_lib
+from datetime import time
+
+import pandas as pd
+from sqlalchemy import create_engine, insert
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+import analytics
+import text_mining
+import data_generator
+
+POLIS = [("Poli Mata", "MATA"), ("Poli Gigi", "GIGI"), ("Poli Anak", "ANAK"), ("Poli Umum", "UMUM"), ("Poli Saraf", "SRF")]
+DOCTORS_PER_POLI = 4
+
+def seed_reference(db):
+    doc_id = 1
+    for poli, prefix in POLIS:
+        db.add(storage.TabelPoli(poli=poli, prefix=prefix))
+        for i in range(1, DOCTORS_PER_POLI + 1):
+            db.add(storage.TabelDokter(doctor_id=doc_id, dokter=f"dr. {prefix.title()}{i}", poli=poli,
+                                       practice_start_time=time(7, 0), practice_end_time=time(16, 0),
+                                       doctor_code=f"{prefix}-{i:03d}", max_patients=None))
+            doc_id += 1
+    db.commit()
+
+def load_visits(db, rows: int, chunk_size: int = 50000):
+    """Isi TabelPelayanan langsung (tanpa user/outbox), lalu bangun rollup & frekuensi kata."""
+    gen = data_generator.VisitGenerator(data_generator.load_doctors(db), seed=42, days=365)
+    cols = [c.name for c in storage.TabelPelayanan.__table__.columns if c.name != "id"]
+    counters, seen = {}, set()
+
+    def next_seq(doc_id, d, n):
+        start = counters.get((doc_id, d), 0) + 1
+        counters[(doc_id, d)] = start + n - 1
+        return start
+
+    written = 0
+    while written < rows:
+        df = gen.generate(min(chunk_size, rows - written))
+        df = data_generator.mark_members(data_generator.assign_queue_numbers(df, next_seq), seen)
+        db.execute(insert(storage.TabelPelayanan), data_generator._records(df, cols))
+        db.commit()
+        written += len(df)
+        print(f"📥 {written}/{rows} baris", end="\r")
+    print()
+    analytics.rebuild_rollups(db)
+    text_mining.rebuild_term_frequencies(db)
+
+def legacy_report(db, start_date=None, end_date=None):
+    """Jalur lama get_analytics (sebelum agregasi SQL), disalin apa adanya."""
+    q = db.query(storage.TabelPelayanan)
+    if start_date: q = q.filter(storage.TabelPelayanan.visit_date >= start_date)
+    if end_date: q = q.filter(storage.TabelPelayanan.visit_date <= end_date)
+    res = q.all()
+    if not res: return {"status": "No Data"}
+
+    df = pd.DataFrame([{
+        "poli": r.poli, "dokter": r.dokter, "checkin": r.checkin_time,
+        "entry": r.clinic_entry_time, "comp": r.completion_time, "catatan": r.catatan_medis
+    } for r in res])
+    for c in ['checkin', 'entry', 'comp']:
+        df[c] = pd.to_datetime(df[c], errors='coerce')
+    df['wait_min'] = (df['entry'] - df['checkin']).dt.total_seconds() / 60
+    df['svc_min'] = (df['comp'] - df['entry']).dt.total_seconds() / 60
+    valid_svc = df[(df['svc_min'] >= 0) & (df['wait_min'] >= 0)].copy()
+
+    corr_val = 0
+    if len(valid_svc) > 1:
+        c = valid_svc['wait_min'].corr(valid_svc['svc_min'])
+        if pd.notna(c): corr_val = round(c, 2)
+
+    txt = " ".join([str(x) for x in df['catatan'].dropna().tolist()])
+    return {
+        "status": "Success",
+        "total_patients": len(df),
+        "poli_volume": df['poli'].value_counts().to_dict(),
+        "peak_hours": df['checkin'].dropna().dt.hour.value_counts().sort_index().to_dict(),
+        "ghost_rate": round(len(df[df['checkin'].isna()]) / len(df) * 100, 1),
+        "doctor_throughput": valid_svc.groupby('dokter')['svc_min'].mean().apply(lambda x: round(60/x, 1) if x > 0 else 0).to_dict(),
+        "poli_efficiency": {
+            p: {
+                "wait_minutes": round(df[df['poli']==p]['wait_min'].mean(), 1) if not df[df['poli']==p]['wait_min'].isnull().all() else 0,
+                "service_minutes": round(df[df['poli']==p]['svc_min'].mean(), 1) if not df[df['poli']==p]['svc_min'].isnull().all() else 0
+            }
+            for p in df['poli'].unique()
+        },
+        "correlation": corr_val,
+        "text_mining": txt
+    }
+
+PATHS = {
+    "rollup": lambda db: analytics.build_report(analytics.aggregate_rollups(db), text_mining.top_terms(db)),
+    "sql": lambda db: analytics.build_report(analytics.aggregate_visits(db), text_mining.top_terms(db)),
+    "legacy": legacy_report,
+}
+TEXT_FIELDS = {"text_mining", "term_frequencies"}
+
+def bind(path: str):
+    engine = create_engine(f"sqlite:///{path}")
+    storage.engine = engine
+    storage.SessionLocal.configure(bind=engine)
+    storage.Base.metadata.create_all(bind=engine)
+
+def measure(path: str, name: str, repeat: int):
+    """Dijalankan di proses anak baru -> max RSS hanya milik jalur ini."""
+    bind(path)
+    db = storage.SessionLocal()
+    try:
+        rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        times = []
+        for _ in range(repeat):
+            t0 = time_lib.perf_counter()
+            report = PATHS[name](db)
+            times.append(time_lib.perf_counter() - t0)
+            db.expunge_all()
+        rss = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0) / 1024
+        return min(times), rss, {k: v for k, v in report.items() if k not in TEXT_FIELDS}
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark laporan analitik: pandas vs SQL vs rollup.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--db", default="bench_analytics.db", help="File SQLite (dihapus & diisi ulang, kecuali --reuse)")
+    parser.add_argument("--reuse", action="store_true", help="Pakai isi database yang sudah ada")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    if not args.reuse and os.path.exists(args.db): os.remove(args.db)
+    bind(args.db)
+    if not args.reuse:
+        db = storage.SessionLocal()
+        try:
+            t0 = time_lib.perf_counter()
+            seed_reference(db)
+            load_visits(db, args.rows)
+            print(f"✅ Dataset {args.rows} baris siap ({time_lib.perf_counter() - t0:.0f} detik)")
+        finally:
+            db.close()
+
+    results = {}
+    ctx = multiprocessing.get_context("spawn")
+    for name in [n for n in PATHS if not (args.skip_legacy and n == "legacy")]:
+        with ctx.Pool(1) as pool:
+            best, rss, results[name] = pool.apply(measure, (args.db, name, args.repeat))
+        print(f"⏱️ {name:<7} {best * 1000:10.1f} ms (terbaik dari {args.repeat})   memori puncak +{rss:.0f} MB")
+
+    names = list(results)
+    for name in names[1:]:
+        same = results[name] == results[names[0]]
+        print(f"{'✅' if same else '❌'} {name} vs {names[0]}: {'identik' if same else 'BEDA'}")
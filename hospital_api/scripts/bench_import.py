@@ -0,0 +1,148 @@
+# FILE: scripts/bench_import.py
+# Benchmark /admin/import-random-data: jalur lama (query + commit per baris) vs pipeline massal
+# (main.import_random_data), masing-masing di database kosong baru. Output: baris/detik.
+#
+#   python scripts/bench_import.py                           # 2000 baris, SQLite
+#   python scripts/bench_import.py --rows 5000 --url mysql+pymysql://root:@localhost/bench_db
+#
+# Default jalur lama memakai satu hash password yang sama (bukan argon2 per pasien) supaya
+# yang diukur hanya round trip & commit; --legacy-hash untuk hash per pasien seperti aslinya.
+import argparse
+import os
+import random
+import sys
+import time as time_lib
+from datetime import datetime, date, time, timedelta
+
+from faker import Faker
+from sqlalchemy import create_engine, func, text
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+os.chdir(HERE) # CSV referensi dibaca relatif dari folder backend
+
+import storage
+import security
+import csv_utils
+import gabungan_sync
+import main
+
+def reset(url: str):
+    if url.startswith("sqlite:///") and os.path.exists(url[len("sqlite:///"):]):
+        os.remove(url[len("sqlite:///"):])
+    engine = create_engine(url)
+    storage.engine = engine
+    storage.SessionLocal.configure(bind=engine)
+    storage.Base.metadata.drop_all(bind=engine)
+    storage.Base.metadata.create_all(bind=engine)
+    main.cache.reference_cache.invalidate()
+    return engine
+
+def legacy_import(db, count: int, hash_each: bool = False):
+    """Jalur lama import_random_data (sebelum pipeline massal), disalin apa adanya."""
+    fake = Faker('id_ID')
+    df_doc = csv_utils.load_clean_csv(csv_utils.FILE_DOKTER)
+    shared_hash = None if hash_each else security.get_password_hash("123")
+    c = 0
+    for i in range(count):
+        row = df_doc.sample(n=1).iloc[0]
+        r_poli = str(row['poli']).strip().title()
+        if not r_poli.startswith("Poli "): r_poli = f"Poli {r_poli}"
+        raw_doc = str(row['dokter']).strip().title()
+        r_doc_name = f"dr. {main.clean_simple_name(raw_doc)}"
+        r_prefix = str(row.get('prefix', r_poli[:4].upper())).strip()
+        try: d_code = row['doctor_code']
+        except: d_code = f"{r_prefix}-001"
+        try: max_p = int(row['max_patients'])
+        except: max_p = 20
+
+        if not db.query(storage.TabelPoli).filter(storage.TabelPoli.poli == r_poli).first():
+            db.add(storage.TabelPoli(poli=r_poli, prefix=r_prefix)); db.commit()
+
+        doc = db.query(storage.TabelDokter).filter(storage.TabelDokter.dokter == r_doc_name).first()
+        if not doc:
+            try:
+                ts = datetime.strptime(str(row['practice_start_time']), "%H:%M:%S").time()
+                te = datetime.strptime(str(row['practice_end_time']), "%H:%M:%S").time()
+            except: ts=time(8,0); te=time(16,0)
+            mid = db.query(func.max(storage.TabelDokter.doctor_id)).scalar() or 0
+            doc = storage.TabelDokter(doctor_id=mid+1, dokter=r_doc_name, poli=r_poli,
+                                      practice_start_time=ts, practice_end_time=te,
+                                      doctor_code=d_code, max_patients=max_p)
+            db.add(doc); db.commit()
+
+        r_nama = main.clean_simple_name(fake.name()).strip().title()
+        uname = r_nama.lower().replace(" ", "") + str(random.randint(1,999))
+        if not db.query(storage.TabelUser).filter(storage.TabelUser.username == uname).first():
+            db.add(storage.TabelUser(username=uname, password=shared_hash or security.get_password_hash("123"), role="pasien", nama_lengkap=r_nama))
+            db.commit()
+
+        if random.random() < 0.4:
+            r_date = date.today()
+            r_stat = random.choices(["Menunggu", "Sedang Dilayani", "Selesai"], weights=[40, 30, 30])[0]
+        else:
+            r_date = fake.date_between(start_date='-30d', end_date='-1d')
+            r_stat = "Selesai"
+
+        t_chk = datetime.combine(r_date, time(random.randint(7, 14), random.randint(0, 59)))
+        t_ent = t_chk + timedelta(minutes=random.randint(10, 60)) if r_stat in ["Sedang Dilayani", "Selesai"] else None
+        t_fin = t_ent + timedelta(minutes=random.randint(10, 30)) if r_stat == "Selesai" else None
+        r_note = None
+        if r_stat != "Menunggu":
+            options = ["Demam", "Flu", "Batuk", "Cek Darah", "Pusing", "Sakit Gigi", "Asam Lambung", "Sehat", "Kontrol Rutin"]
+            r_note = f"{random.choice(options)} - Resep diberikan."
+
+        l_cnt = db.query(storage.TabelPelayanan).filter(
+            storage.TabelPelayanan.doctor_id_ref == doc.doctor_id,
+            storage.TabelPelayanan.visit_date == r_date
+        ).count()
+        q_seq = l_cnt + 1
+        try: suf = doc.doctor_code.split('-')[-1]
+        except: suf = "001"
+        q_str = f"{r_prefix}-{suf}-{q_seq:03d}"
+        stat_mem = "Pasien Lama" if db.query(storage.TabelPelayanan).filter(storage.TabelPelayanan.username == uname).count() > 0 else "Pasien Baru"
+
+        db.add(storage.TabelPelayanan(
+            username=uname, status_member=stat_mem, nama_pasien=r_nama, poli=r_poli,
+            dokter=doc.dokter, doctor_id_ref=doc.doctor_id, visit_date=r_date,
+            checkin_time=t_chk, clinic_entry_time=t_ent, completion_time=t_fin,
+            status_pelayanan=r_stat, queue_number=q_str, queue_sequence=q_seq, catatan_medis=r_note
+        ))
+        db.add(storage.TabelGabungan(
+            username=uname, status_member=stat_mem, nama_pasien=r_nama, poli=r_poli, prefix_poli=r_prefix,
+            dokter=doc.dokter, doctor_code=doc.doctor_code, doctor_id=doc.doctor_id, visit_date=r_date,
+            checkin_time=t_chk, clinic_entry_time=t_ent, completion_time=t_fin,
+            status_pelayanan=r_stat, queue_number=q_str, queue_sequence=q_seq, catatan_medis=r_note
+        ))
+        db.commit()
+        c += 1
+    return c
+
+def bulk_import(db, count: int):
+    main.import_random_data(count, db)
+    while gabungan_sync.worker.run_once(db): pass # TabelGabungan ikut dihitung, seperti jalur lama
+    return db.query(storage.TabelPelayanan).count()
+
+def measure(url: str, name: str, fn, rows: int) -> float:
+    reset(url)
+    db = storage.SessionLocal()
+    try:
+        t0 = time_lib.perf_counter()
+        n = fn(db, rows)
+        dt = time_lib.perf_counter() - t0
+    finally:
+        db.close()
+    print(f"⏱️ {name:<6} {n} baris dalam {dt:.1f} detik -> {n / dt:,.0f} baris/detik")
+    return n / dt
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark import-random-data: per baris vs massal.")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--url", default="sqlite:///bench_import.db", help="Database kosong untuk benchmark (ISINYA DIHAPUS)")
+    parser.add_argument("--legacy-hash", action="store_true", help="Jalur lama: hash argon2 per pasien baru")
+    args = parser.parse_args()
+
+    random.seed(42)
+    before = measure(args.url, "lama", lambda db, n: legacy_import(db, n, args.legacy_hash), args.rows)
+    after = measure(args.url, "massal", bulk_import, args.rows)
+    print(f"✅ Pipeline massal {after / before:.1f}x lebih cepat")
@@ -0,0 +1,127 @@
+# FILE: scripts/loadtest_login.py
+# Uji beban login: latensi endpoint scan (p50/p99) saat sepi vs saat badai login paralel.
+# Backend dijalankan di proses terpisah (uvicorn, SQLite sementara) untuk tiap nilai HASH_WORKERS.
+#
+#   python scripts/loadtest_login.py                       # HASH_WORKERS default (core - 1)
+#   python scripts/loadtest_login.py --workers 0 1 3       # bandingkan beberapa ukuran pool
+#   python scripts/loadtest_login.py --concurrency 80 --scans 300
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time as time_lib
+
+import httpx
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USERS = 200
+
+def serve(db_path: str, port: int):
+    """Proses server: database baru + akun uji, lalu uvicorn."""
+    sys.path.insert(0, HERE)
+    os.chdir(HERE)
+    from sqlalchemy import create_engine
+    import uvicorn
+    import storage
+    import security
+    import main
+
+    if os.path.exists(db_path): os.remove(db_path)
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    storage.engine = engine
+    storage.SessionLocal.configure(bind=engine)
+    storage.Base.metadata.create_all(bind=engine)
+    db = storage.SessionLocal()
+    h = security.get_password_hash("123")
+    db.add(storage.TabelUser(username="admin", password=h, role="admin", nama_lengkap="Admin"))
+    db.add_all([storage.TabelUser(username=f"u{i}", password=h, role="perawat", nama_lengkap=f"Staf {i}") for i in range(USERS)])
+    db.commit(); db.close()
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+def pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * q))] * 1000
+
+def scan_loop(url, headers, n, out, pause=0.02):
+    with httpx.Client() as c:
+        for _ in range(n):
+            t0 = time_lib.perf_counter()
+            c.post(f"{url}/ops/scan-barcode", json={"barcode_data": "X-000-001", "location": "arrival"}, headers=headers)
+            out.append(time_lib.perf_counter() - t0)
+            time_lib.sleep(pause)
+
+def run(workers, concurrency: int, scans: int, port: int) -> dict:
+    env = dict(os.environ)
+    if workers is not None: env["HASH_WORKERS"] = str(workers)
+    db_path = os.path.join(tempfile.mkdtemp(), "loadtest.db")
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", db_path, "--port", str(port)],
+                            env=env, stdout=subprocess.DEVNULL) # Log scan per request tidak perlu ditampilkan
+    url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(300):
+            try:
+                if httpx.get(f"{url}/docs", timeout=1).status_code == 200: break
+            except httpx.HTTPError:
+                pass
+            time_lib.sleep(0.1)
+        token = httpx.post(f"{url}/auth/login", data={"username": "admin", "password": "123"}, timeout=30).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        pool = httpx.get(f"{url}/admin/auth-stats", headers=headers).json()["hash_pool"]
+
+        idle = []
+        scan_loop(url, headers, scans, idle)
+
+        storm, login_lat, codes = [], [], {}
+        done = threading.Event()
+
+        async def storm_logins():
+            # Klien async (bukan thread) agar generator beban sendiri tidak ikut memakan CPU
+            async with httpx.AsyncClient(timeout=60) as c:
+                async def client(i):
+                    while not done.is_set():
+                        t0 = time_lib.perf_counter()
+                        try:
+                            r = await c.post(f"{url}/auth/login", data={"username": f"u{i % USERS}", "password": "123"})
+                            key = r.status_code
+                        except httpx.HTTPError as e:
+                            key = type(e).__name__
+                        login_lat.append(time_lib.perf_counter() - t0)
+                        codes[key] = codes.get(key, 0) + 1
+                        if key == 503: await asyncio.sleep(float(r.headers.get("Retry-After", 1)))
+                await asyncio.gather(*[client(i) for i in range(concurrency)])
+
+        th = threading.Thread(target=asyncio.run, args=(storm_logins(),))
+        t0 = time_lib.perf_counter()
+        th.start()
+        time_lib.sleep(1) # Badai sudah berjalan sebelum scan diukur
+        scan_loop(url, headers, scans, storm)
+        done.set()
+        th.join()
+        return {"workers": pool["workers"], "mode": pool["mode"], "idle": idle, "storm": storm, "login": login_lat,
+                "codes": codes, "seconds": time_lib.perf_counter() - t0}
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Uji beban login vs latensi scan.")
+    parser.add_argument("--workers", type=int, nargs="*", help="Nilai HASH_WORKERS yang dibandingkan (default: bawaan server)")
+    parser.add_argument("--concurrency", type=int, default=40, help="Jumlah klien login paralel (mengulang terus, patuh Retry-After)")
+    parser.add_argument("--scans", type=int, default=100, help="Jumlah scan per fase (sepi / badai)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", metavar="DB", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        sys.exit()
+
+    print(f"🖥️ {os.cpu_count()} core, {args.concurrency} klien login paralel selama fase badai")
+    for w in (args.workers or [None]):
+        r = run(w, args.concurrency, args.scans, args.port)
+        print(f"⏱️ HASH_WORKERS={r['workers']} ({r['mode']}): scan sepi p50 {pct(r['idle'], .5):.0f} ms / p99 {pct(r['idle'], .99):.0f} ms | "
+              f"saat badai p50 {pct(r['storm'], .5):.0f} ms / p99 {pct(r['storm'], .99):.0f} ms | "
+              f"login p99 {pct(r['login'], .99):.0f} ms, status {r['codes']} ({r['seconds']:.1f} detik)")
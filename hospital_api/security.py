@@ -1,11 +1,19 @@
 # FILE: security.py
-from datetime import datetime, timedelta
-from typing import Optional
+import os
+import time as time_lib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
+import storage
+
 # KUNCI RAHASIA (Ganti dengan string acak panjang untuk production)
 SECRET_KEY = "kunci_rahasia_rumah_sakit_ini_sangat_aman_sekali"
 ALGORITHM = "HS256"
@@ -20,13 +28,205 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def _verify_and_update(plain_password, hashed_password):
+    # Return (cocok, hash_baru | None); hash_baru terisi jika parameter CryptContext berubah
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+# [BARU] Hash/verify argon2 untuk login & register dikerjakan di process pool terpisah.
+# Jumlah worker dan antrean dibatasi: saat penuh request langsung ditolak (503)
+# alih-alih menumpuk thread dan memperlambat endpoint lain (scan, papan antrean).
+# Maksimal core - 1: satu core selalu tersisa untuk event loop & endpoint lain.
+# HASH_WORKERS=0 (otomatis di mesin 1 core): tanpa process pool, hash di thread
+# khusus di proses server dengan batas lebih ketat (HASH_INLINE_LIMIT, tanpa antrean).
+# Thread/proses hash berjalan dengan prioritas rendah (nice) agar mengalah saat CPU penuh.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", max(0, (os.cpu_count() or 1) - 1)))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", HASH_WORKERS * 4))
+HASH_INLINE_LIMIT = int(os.getenv("HASH_INLINE_LIMIT", 1))
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", 10))
+HASH_NICE = int(os.getenv("HASH_NICE", 10))
+
+def _lower_priority():
+    """Initializer thread/proses hash. Linux: nice per thread (TID); OS lain dilewati."""
+    try: os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), HASH_NICE)
+    except (AttributeError, OSError): pass
+
+class PasswordPool:
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT, timeout: float = HASH_TIMEOUT,
+                 inline_limit: int = HASH_INLINE_LIMIT):
+        self.workers = workers
+        # Sedang dikerjakan + menunggu; mode inline tanpa antrean (request yang menunggu menahan thread server)
+        self.threads = 0 if workers else max(1, inline_limit)
+        self.capacity = workers + queue_limit if workers else self.threads
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._pool = None
+        self.submitted = self.rejected = self.rehashed = 0
+
+    def start(self):
+        with self._lock:
+            if self._pool is None and not self.workers:
+                self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="hash", initializer=_lower_priority)
+            elif self._pool is None:
+                # spawn: jangan fork proses server yang sudah punya banyak thread
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_lower_priority)
+                # Pemanasan: proses worker + import passlib sudah siap sebelum login pertama
+                for _ in range(self.workers): self._pool.submit(get_password_hash, "warmup")
+        return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool: self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "Server sedang sibuk memproses login, coba lagi sebentar.",
+                                headers={"Retry-After": "1"})
+        try:
+            fut = self.start().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        self.submitted += 1
+        fut.add_done_callback(lambda _: self._slots.release())
+        try:
+            return fut.result(timeout=self.timeout)
+        except FutureTimeout:
+            self.rejected += 1
+            raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "Verifikasi password timeout, coba lagi.",
+                                headers={"Retry-After": "1"})
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "mode": "pool" if self.workers else "inline",
+                "capacity": self.capacity, "submitted": self.submitted,
+                "rejected": self.rejected, "rehashed": self.rehashed}
+
+hash_pool = PasswordPool()
+
+def check_password(plain_password, hashed_password):
+    """Verify via pool. Return (cocok, hash_baru | None) -> simpan hash_baru untuk rehash otomatis."""
+    if not hashed_password: return False, None
+    ok, new_hash = hash_pool.run(_verify_and_update, plain_password, hashed_password)
+    if ok and new_hash: hash_pool.rehashed += 1
+    return ok, new_hash
+
+def hash_password(password):
+    """Hash via pool (register)."""
+    return hash_pool.run(get_password_hash, password)
+
+def get_password_hashes(passwords: List[str], per_user: bool = False) -> List[str]:
+    """Hash banyak password sekaligus untuk seeding / import massal.
+
+    per_user=False: tiap password yang sama cukup di-hash sekali dan hasilnya dipakai
+    bersama (cocok untuk akun sintetis dengan password default).
+    per_user=True: tiap akun tetap dapat hash (salt) sendiri, dikerjakan paralel di
+    process pool sebanyak core CPU.
+    """
+    if not per_user:
+        hashes = {p: get_password_hash(p) for p in set(passwords)}
+        return [hashes[p] for p in passwords]
+    workers = min(os.cpu_count() or 1, len(passwords))
+    if workers <= 1:
+        return [get_password_hash(p) for p in passwords]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(get_password_hash, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# [BARU] Cache token yang sudah diverifikasi: TV/kiosk mengirim token yang sama ribuan kali
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 300 # detik; entry juga tidak pernah melewati `exp` token
+REVOCATION_CHECK_SECONDS = 5.0
+
+def _utc_ts(dt: datetime) -> float:
+    return dt.replace(tzinfo=timezone.utc).timestamp()
+
+class TokenCache:
+    """LRU token -> {username, role}. Revokasi dibaca dari tabel_token_revocation
+    saat stempel auth_version di tabel_meta berubah (dicek per REVOCATION_CHECK_SECONDS)."""
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE, ttl: int = TOKEN_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict() # token -> (user, tv, expires_at)
+        self._lock = threading.Lock()
+        self.revoked = {} # username -> (token_version, revoked_at); token dengan tv < versi ini ditolak
+        self._auth_version = None
+        self._checked_at = 0.0
+        self.hits = self.misses = self.rejected = 0
+
+    def get(self, token: str):
+        now = time_lib.time()
+        with self._lock:
+            item = self._data.get(token)
+            if item and item[2] > now:
+                self._data.move_to_end(token)
+                self.hits += 1
+                return item
+            if item: del self._data[token]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, user: dict, tv: int, exp: float = None):
+        expires = time_lib.time() + self.ttl
+        with self._lock:
+            self._data[token] = (user, tv, min(exp, expires) if exp else expires)
+            self._data.move_to_end(token)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def is_revoked(self, username: str, tv: int) -> bool:
+        # Versi, bukan waktu: login ulang di detik yang sama dengan revokasi tetap sah
+        revoked = self.revoked.get(username)
+        return revoked is not None and tv < revoked[0]
+
+    def revoke(self, username: str, version: int, at: float = None):
+        """Revokasi lokal (proses ini saja); untuk semua worker pakai storage.revoke_user_tokens."""
+        with self._lock:
+            self.revoked[username] = (version, at or time_lib.time())
+            for token in [t for t, (u, _, _) in self._data.items() if u["username"] == username]:
+                del self._data[token]
+
+    def refresh_revocations(self):
+        """Muat ulang daftar revokasi jika stempel auth_version berubah (paling sering tiap REVOCATION_CHECK_SECONDS)."""
+        if time_lib.monotonic() - self._checked_at < REVOCATION_CHECK_SECONDS: return
+        self._checked_at = time_lib.monotonic()
+        db = storage.SessionLocal()
+        try:
+            version = storage.get_meta(db, storage.AUTH_META_KEY)
+            if version == self._auth_version: return
+            # Revokasi yang lebih tua dari umur token sudah tidak berpengaruh
+            since = datetime.utcnow() - timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+            rows = db.query(storage.TabelTokenRevocation).filter(storage.TabelTokenRevocation.revoked_at >= since).all()
+            with self._lock:
+                self.revoked = {u: r for u, r in self.revoked.items() if r[1] >= _utc_ts(since)}
+            for r in rows: self.revoke(r.username, r.token_version, _utc_ts(r.revoked_at))
+            self._auth_version = version
+        except Exception as e:
+            print(f"⚠️ Gagal memuat revokasi token: {e}")
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses, "rejected": self.rejected,
+                "hit_rate": round(self.hits / total * 100, 1) if total else 0.0,
+                "revoked_users": len(self.revoked),
+            }
+
+token_cache = TokenCache()
+
 def get_current_user_token(token: str = Depends(oauth2_scheme)):
     # Fungsi ini hanya men-decode token, validasi database dilakukan di main.py
     credentials_exception = HTTPException(
@@ -34,12 +234,23 @@ def get_current_user_token(token: str = Depends(oauth2_scheme)):
         detail="Kredensial tidak valid",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        role: str = payload.get("role")
-        if username is None:
+    token_cache.refresh_revocations()
+    cached = token_cache.get(token)
+    if cached:
+        user, tv, _ = cached
+    else:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            role: str = payload.get("role")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-        return {"username": username, "role": role}
-    except JWTError:
-        raise credentials_exception
\ No newline at end of file
+        user, tv = {"username": username, "role": role}, payload.get("tv", 0) # Token lama tanpa tv = versi 0
+        token_cache.put(token, user, tv, payload.get("exp"))
+
+    if token_cache.is_revoked(user["username"], tv):
+        token_cache.rejected += 1
+        raise credentials_exception
+    return dict(user) # Salinan, agar entry cache tidak ikut berubah
\ No newline at end of file
@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Integer, String, Date, Time, DateTime, ForeignKey
+from sqlalchemy import create_engine, event, Column, Integer, Float, String, Date, Time, DateTime, ForeignKey, Index, Table, bindparam, func, insert, tuple_, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
 import datetime
 from datetime import datetime
@@ -23,6 +24,21 @@ Base = declarative_base()
 def init_db():
     Base.metadata.create_all(bind=engine)
 
+# [BARU] Callback yang dijalankan setelah transaksi session berhasil di-commit
+def on_commit(db, fn):
+    db.info.setdefault("after_commit", []).append(fn)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _run_after_commit(session):
+    if session.in_nested_transaction(): return # Savepoint, transaksi utama belum selesai
+    for fn in session.info.pop("after_commit", []):
+        fn()
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _drop_after_commit(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop("after_commit", None)
+
 class TabelPoli(Base):
     __tablename__ = "tabel_poli_normal"
     poli = Column(String(100), primary_key=True, index=True)
@@ -64,6 +80,16 @@ class TabelPelayanan(Base):
     
     dokter_rel = relationship("TabelDokter", back_populates="pelayanans")
 
+    # [BARU] Index gabungan untuk query panas (submit, kuota, queue-board, scan)
+    __table_args__ = (
+        Index("ix_pelayanan_dokter_tanggal", "doctor_id_ref", "visit_date"),
+        Index("ix_pelayanan_dokter_tanggal_status", "doctor_id_ref", "visit_date", "status_pelayanan"),
+        Index("ix_pelayanan_user_tanggal_id", "username", "visit_date", "id"),
+        Index("ix_pelayanan_tanggal_status", "visit_date", "status_pelayanan"),
+        Index("ix_pelayanan_nomor", "queue_number"),
+        Index("uq_pelayanan_tanggal_nomor", "visit_date", "queue_number", unique=True),
+    )
+
 class TabelGabungan(Base):
     __tablename__ = "tabel_gabungan_transaksi"
     id = Column(Integer, primary_key=True, index=True)
@@ -86,10 +112,224 @@ class TabelGabungan(Base):
     catatan_medis = Column(String(255), nullable=True)
     status_member = Column(String(20))
 
+    # [BARU] Baris sumber di TabelPelayanan (diisi worker outbox, lihat gabungan_sync.py)
+    pelayanan_id = Column(Integer, nullable=True)
+
+    # [BARU] Sync dari scan_barcode mencari berdasarkan nomor + tanggal
+    __table_args__ = (
+        Index("uq_gabungan_pelayanan", "pelayanan_id", unique=True),
+    )
+
+# [BARU] Arsip (cold storage): kunjungan selesai yang sudah lama dipindah ke sini oleh
+# visit_archive.py, supaya tabel operasional & index-nya tetap kecil. Kolom sama persis
+# dengan tabel asal (id ikut disalin), tanpa foreign key.
+def _archive_table(name: str, source, *indexes) -> Table:
+    cols = [Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable, autoincrement=False)
+            for c in source.__table__.columns]
+    return Table(name, Base.metadata, *cols, *indexes)
+
+class TabelPelayananArsip(Base):
+    __table__ = _archive_table(
+        "tabel_pelayanan_arsip", TabelPelayanan,
+        Index("ix_pelayanan_arsip_user_tanggal_id", "username", "visit_date", "id"),
+        Index("ix_pelayanan_arsip_dokter", "doctor_id_ref"),
+        Index("ix_pelayanan_arsip_poli", "poli"),
+        Index("uq_pelayanan_arsip_tanggal_nomor", "visit_date", "queue_number", unique=True),
+    )
+
+class TabelGabunganArsip(Base):
+    __table__ = _archive_table(
+        "tabel_gabungan_arsip", TabelGabungan,
+        Index("ix_gabungan_arsip_dokter", "doctor_id"),
+        Index("uq_gabungan_arsip_pelayanan", "pelayanan_id", unique=True),
+    )
+
+# Tabel panas + arsip, untuk query riwayat / rebuild yang harus membaca keduanya
+VISIT_TABLES = (TabelPelayanan, TabelPelayananArsip)
+
 class TabelUser(Base):
     __tablename__ = "tabel_users"
     username = Column(String(50), primary_key=True, index=True)
     password = Column(String(255))
     role = Column(String(20)) # 'admin', 'dokter', 'pasien'
     nama_lengkap = Column(String(100))
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # [BARU] Counter kunjungan (lihat visit_counters.py) -> status member tanpa COUNT riwayat
+    total_visits = Column(Integer, nullable=False, default=0, server_default="0")
+    completed_visits = Column(Integer, nullable=False, default=0, server_default="0")
+
+# [BARU] Catatan migrasi skema yang sudah dijalankan
+class TabelSchemaMigration(Base):
+    __tablename__ = "tabel_schema_migrations"
+    version = Column(String(100), primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+# [BARU] Counter nomor urut antrean (1 baris per dokter per tanggal)
+class TabelAntreanCounter(Base):
+    __tablename__ = "tabel_antrean_counter"
+    doctor_id = Column(Integer, primary_key=True)
+    visit_date = Column(Date, primary_key=True)
+    last_sequence = Column(Integer, nullable=False, default=0)
+
+# [BARU] Outbox: tiket yang berubah & perlu disalin ulang ke TabelGabungan oleh worker
+class TabelOutboxGabungan(Base):
+    __tablename__ = "tabel_outbox_gabungan"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    pelayanan_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+# [BARU] Rollup harian analitik (1 baris per tanggal, poli, dokter, jam check-in)
+class TabelRollupHarian(Base):
+    __tablename__ = "tabel_rollup_harian"
+    visit_date = Column(Date, primary_key=True)
+    poli = Column(String(100), primary_key=True)
+    doctor_id = Column(Integer, primary_key=True)
+    hour = Column(Integer, primary_key=True) # -1 = bucket pendaftaran / belum check-in
+    dokter = Column(String(100))
+    registered_count = Column(Integer, nullable=False, default=0)
+    checkin_count = Column(Integer, nullable=False, default=0)
+    completed_count = Column(Integer, nullable=False, default=0)
+    wait_count = Column(Integer, nullable=False, default=0)
+    wait_sum = Column(Float, nullable=False, default=0)
+    wait_sumsq = Column(Float, nullable=False, default=0)
+    service_count = Column(Integer, nullable=False, default=0)
+    service_sum = Column(Float, nullable=False, default=0)
+    service_sumsq = Column(Float, nullable=False, default=0)
+    # Pasangan (tunggu, layanan) yang valid -> throughput & korelasi
+    pair_count = Column(Integer, nullable=False, default=0)
+    pair_wait_sum = Column(Float, nullable=False, default=0)
+    pair_service_sum = Column(Float, nullable=False, default=0)
+    pair_wait_sumsq = Column(Float, nullable=False, default=0)
+    pair_service_sumsq = Column(Float, nullable=False, default=0)
+    pair_cross_sum = Column(Float, nullable=False, default=0)
+
+# [BARU] Frekuensi kata catatan medis per hari (untuk word cloud analitik)
+class TabelTermHarian(Base):
+    __tablename__ = "tabel_term_harian"
+    visit_date = Column(Date, primary_key=True)
+    term = Column(String(50), primary_key=True)
+    frequency = Column(Integer, nullable=False, default=0)
+
+# [BARU] Stempel versi kecil bersama antar worker (mis. versi data referensi poli/dokter)
+class TabelMeta(Base):
+    __tablename__ = "tabel_meta"
+    key = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+# [BARU] Token yang terbit sebelum revoked_at ditolak (mis. role user diubah init_users.py)
+class TabelTokenRevocation(Base):
+    __tablename__ = "tabel_token_revocation"
+    username = Column(String(50), primary_key=True)
+    revoked_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    token_version = Column(Integer, nullable=False, default=0) # Token dengan "tv" lebih kecil ditolak
+
+def upsert_increment(db, model, key: dict, deltas: dict, extra: dict = None):
+    """UPDATE kolom += delta pada baris `key`; INSERT baris baru jika belum ada."""
+    cond = [getattr(model, k) == v for k, v in key.items()]
+    values = {k: getattr(model, k) + v for k, v in deltas.items()}
+    values.update(extra or {})
+
+    for _ in range(3):
+        stmt = update(model).where(*cond).values(**values).execution_options(synchronize_session=False)
+        if db.execute(stmt).rowcount == 1:
+            return
+        try:
+            with db.begin_nested():
+                db.add(model(**key, **deltas, **(extra or {})))
+            return
+        except IntegrityError:
+            pass # Baris dibuat transaksi lain, ulangi UPDATE
+
+    raise RuntimeError(f"Gagal upsert {model.__tablename__} {key}")
+
+def bulk_increment(db, model, rows: list, batch: int = 500):
+    """Versi massal upsert_increment: rows = [(key, deltas, extra), ...] dengan key unik.
+    Per batch: satu SELECT ... IN untuk key yang sudah ada, satu executemany UPDATE,
+    satu INSERT massal untuk key baru."""
+    if not rows: return
+    key_cols = list(rows[0][0])
+    metrics = sorted({c for _, deltas, _ in rows for c in deltas})
+    extras = sorted({c for _, _, extra in rows for c in (extra or {})})
+    table = model.__table__
+    stmt_update = update(table).where(*[table.c[k] == bindparam(f"k_{k}") for k in key_cols]).values(
+        **{c: table.c[c] + bindparam(f"d_{c}") for c in metrics}, **{c: bindparam(f"e_{c}") for c in extras})
+
+    for i in range(0, len(rows), batch):
+        part = rows[i:i + batch]
+        keys = [tuple(key[k] for k in key_cols) for key, _, _ in part]
+        existing = set(db.query(*[getattr(model, k) for k in key_cols])
+                       .filter(tuple_(*[getattr(model, k) for k in key_cols]).in_(keys)).all())
+        old = [(key, deltas, extra or {}) for (key, deltas, extra), k in zip(part, keys) if k in existing]
+        new = [{**key, **deltas, **(extra or {})} for (key, deltas, extra), k in zip(part, keys) if k not in existing]
+
+        if old:
+            db.connection().execute(stmt_update, [{**{f"k_{k}": key[k] for k in key_cols},
+                                                   **{f"d_{c}": deltas.get(c, 0) for c in metrics},
+                                                   **{f"e_{c}": extra.get(c) for c in extras}} for key, deltas, extra in old])
+        if new:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(model), new)
+            except IntegrityError:
+                # Sebagian key dibuat transaksi lain di antara SELECT dan INSERT -> jalur per baris
+                for key, deltas, extra in part:
+                    if tuple(key[k] for k in key_cols) not in existing: upsert_increment(db, model, key, deltas, extra)
+
+def allocate_queue_sequence(db, doctor_id: int, visit_date, max_patients=None, count: int = 1):
+    """Ambil nomor urut antrean berikutnya secara atomik. Return None jika kuota penuh.
+
+    count > 1 memesan satu blok nomor berurutan sekaligus (import massal); yang
+    dikembalikan adalah nomor pertama blok tersebut.
+    """
+    key = (TabelAntreanCounter.doctor_id == doctor_id, TabelAntreanCounter.visit_date == visit_date)
+
+    for _ in range(3):
+        # UPDATE bersyarat: increment + cek kuota dalam satu statement (row lock sampai commit)
+        stmt = update(TabelAntreanCounter).where(*key).values(last_sequence=TabelAntreanCounter.last_sequence + count)
+        if max_patients is not None:
+            stmt = stmt.where(TabelAntreanCounter.last_sequence + count <= max_patients)
+        if db.execute(stmt.execution_options(synchronize_session=False)).rowcount == 1:
+            return db.query(TabelAntreanCounter.last_sequence).filter(*key).scalar() - count + 1
+
+        if db.query(TabelAntreanCounter.doctor_id).filter(*key).first():
+            return None # Baris counter ada tapi kuota habis
+
+        # Baris counter belum ada -> seed dari tiket yang sudah tersimpan (data lama, termasuk arsip)
+        seed = max(db.query(func.max(t.queue_sequence)).filter(
+            t.doctor_id_ref == doctor_id,
+            t.visit_date == visit_date
+        ).scalar() or 0 for t in VISIT_TABLES)
+        try:
+            with db.begin_nested():
+                db.add(TabelAntreanCounter(doctor_id=doctor_id, visit_date=visit_date, last_sequence=seed))
+        except IntegrityError:
+            pass # Dibuat request lain secara bersamaan, ulangi UPDATE
+
+    raise RuntimeError(f"Gagal alokasi nomor antrean dokter {doctor_id} tanggal {visit_date}")
+
+def bump_queue_sequence(db, doctor_id: int, visit_date, sequence: int):
+    """Naikkan counter minimal ke `sequence` (setelah tiket dimasukkan dari luar, mis. import arsip)."""
+    key = (TabelAntreanCounter.doctor_id == doctor_id, TabelAntreanCounter.visit_date == visit_date)
+    if db.query(TabelAntreanCounter.doctor_id).filter(*key).first():
+        db.execute(update(TabelAntreanCounter).where(*key, TabelAntreanCounter.last_sequence < sequence)
+                   .values(last_sequence=sequence).execution_options(synchronize_session=False))
+    # Baris belum ada -> tidak perlu apa-apa, allocate_queue_sequence seed dari max(queue_sequence)
+
+def get_meta(db, key: str) -> int:
+    return db.query(TabelMeta.value).filter(TabelMeta.key == key).scalar() or 0
+
+def bump_meta(db, key: str):
+    """Naikkan stempel versi `key` (ikut transaksi yang sedang berjalan)."""
+    upsert_increment(db, TabelMeta, {"key": key}, {"value": 1})
+
+AUTH_META_KEY = "auth_version"
+
+def revoke_user_tokens(db, username: str):
+    """Batalkan semua token user yang sudah terbit (ikut transaksi yang sedang berjalan)."""
+    upsert_increment(db, TabelTokenRevocation, {"username": username}, {"token_version": 1},
+                     extra={"revoked_at": datetime.utcnow()})
+    bump_meta(db, AUTH_META_KEY)
+
+def token_version(db, username: str) -> int:
+    """Versi token user saat ini (klaim "tv" di token baru)."""
+    return db.query(TabelTokenRevocation.token_version).filter(TabelTokenRevocation.username == username).scalar() or 0
@@ -0,0 +1,45 @@
+# FILE: tests/conftest.py
+# Database uji: SQLite file sementara per test (engine & SessionLocal di storage di-bind ulang),
+# jadi tidak butuh server MySQL.
+#
+#   cd hospital_api && python -m pytest -q
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+
+@pytest.fixture
+def engine(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    storage.engine = eng
+    storage.SessionLocal.configure(bind=eng)
+    storage.Base.metadata.create_all(bind=eng)
+    yield eng
+    eng.dispose()
+
+@pytest.fixture
+def db(engine):
+    session = storage.SessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture
+def client(engine):
+    """TestClient dengan lifespan lengkap (migrasi, live queue, worker outbox, pool hash)."""
+    from fastapi.testclient import TestClient
+    import main
+    # State per proses dari test sebelumnya tidak boleh terbawa ke database baru
+    main.cache.reference_cache.invalidate()
+    main.cache.report_cache.clear()
+    main.live_queue.engine.mark_stale()
+    with TestClient(main.app) as c:
+        yield c
+
+def auth_header(username: str, role: str) -> dict:
+    import security
+    return {"Authorization": f"Bearer {security.create_access_token(data={'sub': username, 'role': role})}"}
@@ -0,0 +1,19 @@
+# FILE: tests/test_archive_writer.py
+# Arsip CSV write-behind: baris yang ditulis setelah close() tidak boleh hilang diam-diam.
+import pytest
+
+import csv_utils
+
+def test_write_after_close_raises_until_restarted(tmp_path):
+    w = csv_utils.ArchiveWriter(str(tmp_path), flush_seconds=0.1)
+    w.write("poli", {"poli": "Poli Mata", "prefix": "MATA"})
+    w.close()
+    with pytest.raises(RuntimeError):
+        w.write("poli", {"poli": "Poli Gigi", "prefix": "GIGI"})
+
+    w.start()
+    w.write("poli", {"poli": "Poli Gigi", "prefix": "GIGI"})
+    w.close()
+    (path,) = tmp_path.iterdir()
+    assert path.read_text().splitlines() == ["poli,prefix", "Poli Mata,MATA", "Poli Gigi,GIGI"]
+    assert w.stats() == {"pending": 0, "written": 2, "flushes": 2, "errors": 0}
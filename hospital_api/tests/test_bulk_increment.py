@@ -0,0 +1,36 @@
+# FILE: tests/test_bulk_increment.py
+# Import massal menulis rollup & frekuensi kata sekaligus; hasilnya harus sama dengan jalur per baris.
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import storage
+import analytics
+import text_mining
+
+def test_bulk_increment_updates_existing_and_inserts_new(db):
+    d = date(2024, 1, 2)
+    storage.upsert_increment(db, storage.TabelTermHarian, {"visit_date": d, "term": "demam"}, {"frequency": 3})
+    db.commit()
+
+    text_mining.record_notes(db, [(d, "demam batuk"), (d, "Demam tinggi"), (date(2024, 1, 3), "batuk")])
+    db.commit()
+    got = {(r.visit_date, r.term): r.frequency for r in db.query(storage.TabelTermHarian)}
+    assert got == {(d, "demam"): 5, (d, "batuk"): 1, (d, "tinggi"): 1, (date(2024, 1, 3), "batuk"): 1}
+
+def test_record_visits_matches_per_row_path(db):
+    def tickets(d):
+        t0 = datetime(d.year, d.month, d.day, 9)
+        full = dict(checkin_time=t0, clinic_entry_time=t0.replace(minute=20), completion_time=t0.replace(minute=35))
+        empty = dict(checkin_time=None, clinic_entry_time=None, completion_time=None)
+        return [SimpleNamespace(visit_date=d, poli="Poli Mata", doctor_id_ref=1, dokter="dr. Jeri", **(full if i % 2 else empty))
+                for i in range(5)]
+    old, new = date(2024, 1, 2), date(2024, 1, 3)
+    for t in tickets(old): analytics.record_visit(db, t)
+    analytics.record_visit(db, tickets(new)[1]) # Sebagian bucket sudah ada sebelum import massal
+    db.commit()
+
+    analytics.record_visits(db, tickets(new)[:1] + tickets(new)[2:])
+    db.commit()
+    rows = lambda d: {r.hour: tuple(getattr(r, c) for c in analytics.METRIC_COLUMNS)
+                      for r in db.query(storage.TabelRollupHarian).filter_by(visit_date=d)}
+    assert rows(new) == rows(old) and set(rows(new)) == {-1, 9}
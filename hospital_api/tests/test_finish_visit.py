@@ -0,0 +1,53 @@
+# FILE: tests/test_finish_visit.py
+# /ops/finish-visit menyelesaikan tiket by id: nomor antrean yang sama di tanggal lain tidak ikut tersentuh.
+from datetime import date, datetime, timedelta
+
+import storage
+from conftest import auth_header
+
+def ticket(visit_date, status="Sedang Dilayani"):
+    return storage.TabelPelayanan(username="budi", nama_pasien="Budi", poli="Poli Mata", dokter="dr. Jeri",
+                                  doctor_id_ref=1, visit_date=visit_date, status_pelayanan=status,
+                                  checkin_time=datetime.now(), clinic_entry_time=datetime.now(),
+                                  queue_number="MATA-001-001", queue_sequence=1)
+
+def test_finish_visit_targets_ticket_id(client, db):
+    today = ticket(date.today())
+    db.add(today); db.commit()
+    # Tiket lama bernomor sama, masuk belakangan (import arsip) -> id lebih besar
+    old = ticket(date.today() - timedelta(days=3))
+    db.add(old); db.commit()
+
+    r = client.post("/ops/finish-visit", json={"id": today.id, "catatan": "Flu ringan, resep diberikan"},
+                    headers=auth_header("admin", "admin"))
+    assert r.json()["status"] == "Success"
+
+    db.expire_all()
+    assert (today.status_pelayanan, today.catatan_medis) == ("Selesai", "Flu ringan, resep diberikan")
+    assert (old.status_pelayanan, old.catatan_medis) == ("Sedang Dilayani", None)
+
+def test_finish_visit_unknown_id(client):
+    r = client.post("/ops/finish-visit", json={"id": 999, "catatan": "Flu ringan"}, headers=auth_header("admin", "admin"))
+    assert r.status_code == 404
+
+def test_finish_visit_keeps_note_when_cas_retries(client, db, monkeypatch):
+    import main
+    from sqlalchemy import false
+    t = ticket(date.today())
+    db.add(t)
+    storage.bump_meta(db, main.live_queue.QUEUE_META_KEY) # Baris stempel sudah ada -> touch tanpa savepoint (tanpa flush)
+    db.commit()
+
+    # CAS pertama kalah (seolah meja lain menulis duluan) -> tiket dibaca ulang dengan populate_existing
+    real_update, lost = main.update, []
+    def flaky_update(table):
+        stmt = real_update(table)
+        if table is storage.TabelPelayanan and not lost:
+            lost.append(True); stmt = stmt.where(false())
+        return stmt
+    monkeypatch.setattr(main, "update", flaky_update)
+
+    r = client.post("/ops/finish-visit", json={"id": t.id, "catatan": "Flu ringan"}, headers=auth_header("admin", "admin"))
+    assert lost and r.json()["status"] == "Success"
+    db.expire_all()
+    assert (t.status_pelayanan, t.catatan_medis) == ("Selesai", "Flu ringan")
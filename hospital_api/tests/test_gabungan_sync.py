@@ -0,0 +1,39 @@
+# FILE: tests/test_gabungan_sync.py
+# Worker outbox TabelGabungan di beberapa proses: klaim baris tanpa saling tunggu, upsert tidak dobel.
+from datetime import date
+
+from sqlalchemy.dialects import mysql
+
+import storage
+import gabungan_sync
+
+def test_claim_skips_rows_locked_by_other_workers(db):
+    sql = str(gabungan_sync.claim(db, 10).statement.compile(dialect=mysql.dialect()))
+    assert sql.endswith("FOR UPDATE SKIP LOCKED")
+
+def test_same_ticket_in_two_batches_upserts_once(db):
+    t = storage.TabelPelayanan(username="budi", nama_pasien="Budi", poli="Poli Mata", dokter="dr. Jeri",
+                               doctor_id_ref=1, visit_date=date.today(), status_pelayanan="Menunggu",
+                               queue_number="MATA-001-001", queue_sequence=1)
+    db.add(t); db.flush()
+    gabungan_sync.enqueue(db, t.id, t.id, t.id)
+    db.commit()
+
+    worker_a, worker_b = gabungan_sync.OutboxWorker(batch_size=1), gabungan_sync.OutboxWorker(batch_size=2)
+    assert worker_a.run_once(db) == 1 and worker_b.run_once(db) == 2
+    assert db.query(storage.TabelGabungan).filter(storage.TabelGabungan.pelayanan_id == t.id).count() == 1
+    assert db.query(storage.TabelOutboxGabungan).count() == 0
+
+def test_resync_rebuilds_in_place_and_drops_orphans(db):
+    t = storage.TabelPelayanan(username="budi", nama_pasien="Budi", poli="Poli Mata", dokter="dr. Jeri",
+                               doctor_id_ref=1, visit_date=date.today(), status_pelayanan="Selesai",
+                               queue_number="MATA-001-001", queue_sequence=1)
+    db.add(t); db.flush()
+    G = storage.TabelGabungan
+    db.add_all([G(pelayanan_id=t.id, status_pelayanan="Menunggu"), G(pelayanan_id=t.id + 100), G(pelayanan_id=None)])
+    db.commit()
+    kept = db.query(G.id).filter(G.pelayanan_id == t.id).scalar()
+
+    assert gabungan_sync.resync(db) == 1
+    rows = db.query(G.id, G.pelayanan_id, G.status_pelayanan).all()
+    assert rows == [(kept, t.id, "Selesai")] # Baris yang ada di-update, bukan dihapus lalu dibuat ulang
@@ -0,0 +1,111 @@
+# FILE: tests/test_live_queue.py
+# State antrean di memori harus ikut berubah di worker lain (stempel queue_version di tabel_meta).
+from datetime import date, time
+
+import storage
+import live_queue
+from conftest import auth_header
+
+def seed(db):
+    db.add(storage.TabelPoli(poli="Poli Mata", prefix="MATA"))
+    db.add(storage.TabelDokter(doctor_id=1, dokter="dr. Jeri", poli="Poli Mata", practice_start_time=time(0, 0),
+                               practice_end_time=time(23, 59), doctor_code="MATA-001", max_patients=None))
+    db.add(storage.TabelUser(username="budi", password="-", role="pasien", nama_lengkap="Budi"))
+    db.commit()
+
+def test_write_in_one_worker_reaches_other_worker(client, db):
+    seed(db)
+    other = live_queue.LiveQueue(check_seconds=0) # Worker lain: proses terpisah, memori sendiri
+    other.load(db)
+    assert other.board(db) == []
+
+    r = client.post("/public/submit", json={"poli": "Poli Mata", "doctor_id": 1, "visit_date": str(date.today())},
+                    headers=auth_header("budi", "pasien"))
+    q = r.json()["queue_number"]
+    client.post("/ops/scan-barcode", json={"barcode_data": q, "location": "arrival"}, headers=auth_header("admin", "admin"))
+
+    db.expire_all()
+    assert [(t.queue_number, t.status_pelayanan) for t in other.board(db)] == [(q, "Menunggu")]
+    # Worker yang menulis cukup write-through, tanpa muat ulang
+    local = live_queue.engine
+    assert local.stamp == other.stamp == storage.get_meta(db, live_queue.QUEUE_META_KEY)
+
+def test_own_writes_do_not_reload(client, db):
+    seed(db)
+    local = live_queue.engine
+    local.check_seconds = 0
+    try:
+        local.board(db)
+        rebuilds = local.rebuilds
+        r = client.post("/public/submit", json={"poli": "Poli Mata", "doctor_id": 1, "visit_date": str(date.today())},
+                        headers=auth_header("budi", "pasien"))
+        client.post("/ops/scan-barcode", json={"barcode_data": r.json()["queue_number"], "location": "arrival"},
+                    headers=auth_header("admin", "admin"))
+        db.expire_all()
+        assert len(local.board(db)) == 1 and local.rebuilds == rebuilds
+    finally:
+        local.check_seconds = live_queue.STAMP_CHECK_SECONDS
+
+def test_board_etag_shared_across_workers(client, db):
+    seed(db)
+    admin = auth_header("admin", "admin")
+    etag = client.get("/monitor/queue-board", headers=admin).headers["etag"]
+    other = live_queue.LiveQueue(check_seconds=0)
+    assert etag == f'W/"{other.current_version(db)}"' # Worker lain, isi sama -> ETag sama
+    assert client.get("/monitor/queue-board", headers={**admin, "If-None-Match": etag}).status_code == 304
+
+    # Tiket baru ditulis lewat worker lain
+    db.add(storage.TabelPelayanan(username="budi", nama_pasien="Budi", poli="Poli Mata", dokter="dr. Jeri",
+                                  doctor_id_ref=1, visit_date=date.today(), status_pelayanan="Menunggu",
+                                  queue_number="MATA-001-001", queue_sequence=1))
+    live_queue.touch(db, date.today())
+    db.commit()
+
+    live_queue.engine.check_seconds = 0
+    try:
+        r = client.get("/monitor/queue-board", headers={**admin, "If-None-Match": etag})
+    finally:
+        live_queue.engine.check_seconds = live_queue.STAMP_CHECK_SECONDS
+    assert r.status_code == 200 and [t["queue_number"] for t in r.json()] == ["MATA-001-001"]
+    assert r.headers["etag"] == f'W/"{other.current_version(db)}"' != etag
+
+def test_other_worker_write_reaches_sse_subscribers(db):
+    import asyncio
+    import queue_events
+    seed(db)
+    other = live_queue.LiveQueue(check_seconds=0)
+    broker = queue_events.QueueBroker()
+    other.listeners.append(broker.publish_changes)
+    other.load(db)
+
+    async def run():
+        sub = broker.subscribe()
+        t = storage.TabelPelayanan(username="budi", nama_pasien="Budi", poli="Poli Mata", dokter="dr. Jeri",
+                                   doctor_id_ref=1, visit_date=date.today(), status_pelayanan="Menunggu",
+                                   queue_number="MATA-001-001", queue_sequence=1)
+        db.add(t); live_queue.touch(db, date.today()); db.commit()
+        other.refresh(db)
+        first = await asyncio.wait_for(sub.queue.get(), 1)
+
+        t.status_pelayanan = "Sedang Dilayani"; live_queue.touch(db, date.today()); db.commit()
+        other.refresh(db)
+        second = await asyncio.wait_for(sub.queue.get(), 1)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert (first["type"], first["ticket"]["status_pelayanan"]) == ("added", "Menunggu")
+    assert (second["type"], second["ticket"]["status_pelayanan"]) == ("status", "Sedang Dilayani")
+
+def test_active_patient_served_from_live_queue(client, db):
+    seed(db)
+    admin = auth_header("admin", "admin")
+    r = client.post("/public/submit", json={"poli": "Poli Mata", "doctor_id": 1, "visit_date": str(date.today())},
+                    headers=auth_header("budi", "pasien"))
+    q = r.json()["queue_number"]
+    assert client.get("/ops/active-patient?doctor_id=1", headers=admin).json()["patient"] is None
+
+    for loc in ("arrival", "clinic"):
+        client.post("/ops/scan-barcode", json={"barcode_data": q, "location": loc}, headers=admin)
+    rebuilds = live_queue.engine.rebuilds
+    patient = client.get("/ops/active-patient?doctor_id=1", headers=admin).json()["patient"]
+    assert patient["queue_number"] == q and live_queue.engine.rebuilds == rebuilds # Write-through, tanpa muat ulang
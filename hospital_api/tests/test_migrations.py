@@ -0,0 +1,24 @@
+# FILE: tests/test_migrations.py
+# Semua migrasi dijalankan berurutan di database baru:
+# hasil akhirnya harus sama dengan index yang didefinisikan di model.
+import pytest
+from sqlalchemy import inspect
+
+import storage
+import migrations
+
+@pytest.mark.parametrize("model", [storage.TabelPelayanan, storage.TabelGabungan])
+def test_migrations_end_with_model_indexes(engine, model):
+    migrations.run_migrations(engine)
+    in_db = {ix["name"] for ix in inspect(engine).get_indexes(model.__tablename__)}
+    assert in_db == {ix.name for ix in model.__table__.indexes}
+
+def test_retired_indexes_dropped_from_older_database(engine):
+    # Database lama yang masih punya index yang sudah tidak dipakai
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE INDEX ix_pelayanan_user_tanggal ON tabel_pelayanan_normal (username, visit_date)")
+        conn.exec_driver_sql("CREATE INDEX ix_gabungan_nomor_tanggal ON tabel_gabungan_transaksi (queue_number, visit_date)")
+    migrations.run_migrations(engine)
+    for model in (storage.TabelPelayanan, storage.TabelGabungan):
+        in_db = {ix["name"] for ix in inspect(engine).get_indexes(model.__tablename__)}
+        assert in_db == {ix.name for ix in model.__table__.indexes}
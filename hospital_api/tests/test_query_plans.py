@@ -0,0 +1,60 @@
+# FILE: tests/test_query_plans.py
+# Query panas harus memakai index (SEARCH ... USING INDEX), bukan scan seluruh tabel.
+# Bentuk query disamakan dengan yang dipakai di main.py / storage.py / gabungan_sync.py.
+from datetime import date
+
+import pytest
+from sqlalchemy import func, or_, and_
+
+import storage
+import migrations
+
+P, PA, G = storage.TabelPelayanan, storage.TabelPelayananArsip, storage.TabelGabungan
+C = storage.TabelAntreanCounter
+TODAY = date.today()
+
+def explain(db, query) -> str:
+    stmt = query.statement if hasattr(query, "statement") else query
+    compiled = stmt.compile(dialect=db.bind.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[k] for k in compiled.positiontup)
+    rows = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params).all()
+    return " | ".join(r[-1] for r in rows)
+
+HOT_QUERIES = {
+    # submit: satu tiket per pasien per hari
+    "one_ticket_per_day": (lambda db: db.query(P.id).filter(P.username == "budi", P.visit_date == TODAY),
+                           "ix_pelayanan_user_tanggal_id"),
+    # allocate_queue_sequence: counter + seed dari tiket yang ada
+    "queue_counter": (lambda db: db.query(C.last_sequence).filter(C.doctor_id == 1, C.visit_date == TODAY),
+                      "sqlite_autoindex_tabel_antrean_counter"),
+    "queue_seed": (lambda db: db.query(func.max(P.queue_sequence)).filter(P.doctor_id_ref == 1, P.visit_date == TODAY),
+                   "ix_pelayanan_dokter_tanggal"),
+    # live_queue: muat tiket hari ini
+    "live_queue_load": (lambda db: db.query(P).filter(P.visit_date == TODAY),
+                        ("ix_pelayanan_tanggal_status", "uq_pelayanan_tanggal_nomor")), # Keduanya berawalan visit_date
+    # scan-barcode: cari tiket by nomor antrean
+    "scan_find_ticket": (lambda db: db.query(P).filter(P.queue_number == "MATA-001-001").order_by(P.id.desc()),
+                         "ix_pelayanan_nomor"),
+    # /ops/active-patient
+    "active_patient": (lambda db: db.query(P).filter(P.doctor_id_ref == 1, P.visit_date == TODAY,
+                                                     P.status_pelayanan == "Sedang Dilayani").order_by(P.id.desc()),
+                       "ix_pelayanan_dokter_tanggal_status"),
+    # /public/my-history halaman berikutnya (tabel panas & arsip)
+    "history_page": (lambda db: db.query(P.id).filter(P.username == "budi", or_(P.visit_date < TODAY, and_(P.visit_date == TODAY, P.id < 10)))
+                     .order_by(P.visit_date.desc(), P.id.desc()).limit(21), "ix_pelayanan_user_tanggal_id"),
+    "history_page_archive": (lambda db: db.query(PA.id).filter(PA.username == "budi", or_(PA.visit_date < TODAY, and_(PA.visit_date == TODAY, PA.id < 10)))
+                             .order_by(PA.visit_date.desc(), PA.id.desc()).limit(21), "ix_pelayanan_arsip_user_tanggal_id"),
+    # Worker outbox: upsert TabelGabungan per tiket
+    "gabungan_materialize": (lambda db: db.query(G.pelayanan_id, G.id).filter(G.pelayanan_id.in_([1, 2, 3])),
+                             "uq_gabungan_pelayanan"),
+    # Cek sebelum hapus / pindah poli dokter
+    "doctor_visit_count": (lambda db: db.query(func.count(P.id)).filter(P.doctor_id_ref == 1), "ix_pelayanan_dokter_tanggal"),
+}
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_index(engine, db, name):
+    migrations.run_migrations(engine) # Skema yang sama dengan database hasil migrasi
+    build, indexes = HOT_QUERIES[name]
+    plan = explain(db, build(db))
+    assert "SCAN" not in plan, plan
+    assert any(ix in plan for ix in ([indexes] if isinstance(indexes, str) else indexes)), plan
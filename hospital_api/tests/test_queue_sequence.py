@@ -0,0 +1,68 @@
+# FILE: tests/test_queue_sequence.py
+# Alokasi nomor antrean (storage.allocate_queue_sequence) di bawah submit paralel.
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time, timedelta
+
+import storage
+from conftest import auth_header
+
+PATIENTS = 300
+MAX_PATIENTS = 150
+
+def seed_doctor(db, max_patients=MAX_PATIENTS):
+    db.add(storage.TabelPoli(poli="Poli Mata", prefix="MATA"))
+    db.add(storage.TabelDokter(doctor_id=1, dokter="dr. Jeri", poli="Poli Mata", practice_start_time=time(0, 0),
+                               practice_end_time=time(23, 59), doctor_code="MATA-001", max_patients=max_patients))
+    db.commit()
+
+def test_parallel_submits_no_duplicates_and_quota(client, db):
+    seed_doctor(db)
+    db.add_all([storage.TabelUser(username=f"u{i}", password="-", role="pasien", nama_lengkap=f"Pasien {i}")
+                for i in range(PATIENTS)])
+    db.commit()
+    # Besok: tidak terpengaruh cek jam praktek hari ini
+    visit_date = str(date.today() + timedelta(days=1))
+
+    def submit(i):
+        r = client.post("/public/submit", json={"poli": "Poli Mata", "doctor_id": 1, "visit_date": visit_date},
+                        headers=auth_header(f"u{i}", "pasien"))
+        return r.status_code, r.json()
+
+    with ThreadPoolExecutor(50) as ex:
+        results = list(ex.map(submit, range(PATIENTS)))
+
+    ok = [body for code, body in results if code == 200]
+    full = [body for code, body in results if code == 400 and "Kuota" in body["detail"]]
+    assert len(ok) == MAX_PATIENTS
+    assert len(full) == PATIENTS - MAX_PATIENTS
+    assert sorted(b["queue_sequence"] for b in ok) == list(range(1, MAX_PATIENTS + 1))
+    assert len({b["queue_number"] for b in ok}) == MAX_PATIENTS
+    assert db.query(storage.TabelPelayanan).count() == MAX_PATIENTS
+
+def test_seed_counts_archived_visits(db):
+    seed_doctor(db, max_patients=None)
+    old = date.today() - timedelta(days=200)
+    # Tanggal ini sudah diarsipkan seluruhnya & baris counter-nya tidak ada
+    db.add(storage.TabelPelayananArsip(id=1, doctor_id_ref=1, visit_date=old, queue_number="MATA-001-007",
+                                       queue_sequence=7, status_pelayanan="Selesai"))
+    db.commit()
+
+    assert storage.allocate_queue_sequence(db, 1, old) == 8
+
+def test_duplicate_doctor_code_returns_409(client, db):
+    seed_doctor(db)
+    # Dokter kedua di poli yang sama dengan kode yang sama -> nomor antrean pertama bentrok
+    db.add(storage.TabelDokter(doctor_id=2, dokter="dr. Sari", poli="Poli Mata", practice_start_time=time(0, 0),
+                               practice_end_time=time(23, 59), doctor_code="MATA-001", max_patients=None))
+    db.add_all([storage.TabelUser(username=u, password="-", role="pasien", nama_lengkap=u) for u in ("budi", "ani")])
+    db.commit()
+    visit_date = str(date.today() + timedelta(days=1))
+
+    r1 = client.post("/public/submit", json={"poli": "Poli Mata", "doctor_id": 1, "visit_date": visit_date},
+                     headers=auth_header("budi", "pasien"))
+    r2 = client.post("/public/submit", json={"poli": "Poli Mata", "doctor_id": 2, "visit_date": visit_date},
+                     headers=auth_header("ani", "pasien"))
+    assert r1.status_code == 200 and r2.status_code == 409
+    db.expire_all()
+    assert db.query(storage.TabelPelayanan).count() == 1
+    assert db.query(storage.TabelUser.total_visits).filter_by(username="ani").scalar() == 0
@@ -0,0 +1,34 @@
+# FILE: tests/test_report_cache.py
+# Cache laporan range lampau (tanpa TTL) harus ikut dibuang di worker lain setelah tulisan tanggal lampau.
+from datetime import date, timedelta
+
+import cache
+
+PAST = (date.today() - timedelta(days=30), date.today() - timedelta(days=1))
+OLDER = (date.today() - timedelta(days=90), date.today() - timedelta(days=60))
+
+def test_past_write_invalidates_other_workers(db):
+    worker_a, worker_b = cache.ReportCache(check_seconds=0), cache.ReportCache(check_seconds=0)
+    for w in (worker_a, worker_b):
+        w.sync(db)
+        w.put(PAST, {"total_patients": 1}, w.generation)
+        w.put(OLDER, {"total_patients": 2}, w.generation)
+
+    # Worker A mengimpor kunjungan kemarin
+    yesterday = date.today() - timedelta(days=1)
+    worker_a.bump(db)
+    db.commit()
+    worker_a.invalidate([yesterday])
+
+    worker_a.sync(db)
+    worker_b.sync(db)
+    assert worker_a.get(PAST) is None and worker_a.get(OLDER) == {"total_patients": 2} # Tulisan sendiri: per tanggal saja
+    assert worker_b.get(PAST) is None and worker_b.get(OLDER) is None # Worker lain: buang semua
+
+def test_today_write_keeps_past_ranges(db):
+    worker = cache.ReportCache(check_seconds=0)
+    worker.sync(db)
+    worker.put(PAST, {"total_patients": 1}, worker.generation)
+    worker.invalidate([date.today()])
+    worker.sync(db)
+    assert worker.get(PAST) == {"total_patients": 1}
@@ -0,0 +1,34 @@
+# FILE: tests/test_token_revocation.py
+# Revokasi token per versi: token lama ditolak, login ulang di detik yang sama tetap diterima.
+import security
+import storage
+
+def login_token(db, username="budi"):
+    return security.create_access_token(data={"sub": username, "role": "pasien", "tv": storage.token_version(db, username)})
+
+def test_relogin_in_same_second_as_revocation(client, db, monkeypatch):
+    monkeypatch.setattr(security, "REVOCATION_CHECK_SECONDS", 0)
+    monkeypatch.setattr(security, "token_cache", security.TokenCache())
+    db.add(storage.TabelUser(username="budi", password="-", role="pasien", nama_lengkap="Budi"))
+    db.commit()
+    history = lambda tok: client.get("/public/my-history", headers={"Authorization": f"Bearer {tok}"}).status_code
+
+    old = login_token(db)
+    assert history(old) == 200 # Masuk cache token
+
+    storage.revoke_user_tokens(db, "budi")
+    db.commit()
+    fresh = login_token(db) # Detik yang sama dengan revokasi
+
+    assert history(old) == 401
+    assert history(fresh) == 200
+
+def test_migrated_revocations_still_reject_old_tokens(engine, db):
+    import migrations
+    from sqlalchemy import text
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE tabel_token_revocation"))
+        conn.execute(text("CREATE TABLE tabel_token_revocation (username VARCHAR(50) PRIMARY KEY, revoked_at DATETIME NOT NULL)"))
+        conn.execute(text("INSERT INTO tabel_token_revocation VALUES ('budi', '2024-01-01 00:00:00')"))
+    migrations.run_migrations(engine)
+    assert storage.token_version(db, "budi") == 1 # Token tanpa "tv" (versi 0) ditolak
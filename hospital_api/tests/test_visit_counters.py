@@ -0,0 +1,27 @@
+# FILE: tests/test_visit_counters.py
+# recount memperbaiki counter yang meleset dan melaporkan user mana saja yang berubah.
+from datetime import date
+
+import storage
+import visit_counters
+
+def visit(username, status):
+    return storage.TabelPelayanan(username=username, nama_pasien=username, poli="Poli Mata", dokter="dr. Jeri",
+                                  doctor_id_ref=1, visit_date=date.today(), status_pelayanan=status,
+                                  queue_number=f"MATA-001-{username}-{status}", queue_sequence=1)
+
+def test_recount_returns_only_drifted_users(db):
+    db.add_all([
+        storage.TabelUser(username="budi", password="-", role="pasien", total_visits=2, completed_visits=1),
+        storage.TabelUser(username="sari", password="-", role="pasien", total_visits=5, completed_visits=0),
+        storage.TabelUser(username="anto", password="-", role="pasien"),
+    ])
+    db.add_all([visit("budi", "Selesai"), visit("budi", "Menunggu"), visit("sari", "Selesai")])
+    db.commit()
+
+    drift = visit_counters.recount(db)
+    assert drift == [{"username": "sari", "total_visits": 5, "completed_visits": 0,
+                      "expected_total": 1, "expected_completed": 1}]
+    got = dict(db.query(storage.TabelUser.username, storage.TabelUser.total_visits))
+    assert got == {"budi": 2, "sari": 1, "anto": 0}
+    assert visit_counters.recount(db) == []
@@ -0,0 +1,81 @@
+# FILE: text_mining.py
+# Frekuensi kata catatan medis per hari, di-update setiap catatan ditulis.
+# Laporan cukup menjumlahkan top-K kata, bukan mengirim seluruh teks catatan.
+import re
+from collections import Counter
+from sqlalchemy import func, insert
+
+import storage
+import cache
+
+TOP_K = 100
+MAX_TERM_LEN = 50
+
+STOPWORDS = {
+    "yang", "dan", "di", "ke", "dari", "untuk", "dengan", "pada", "ini", "itu", "adalah",
+    "atau", "tidak", "ada", "akan", "sudah", "telah", "juga", "saja", "karena", "oleh",
+    "dalam", "sebagai", "bisa", "dapat", "lebih", "masih", "belum", "agar", "jika", "maka",
+    "sangat", "hari", "kali", "per", "setelah", "sebelum", "serta", "para", "kami", "kita",
+    "saya", "anda", "dia", "mereka", "nya", "pun", "lah", "kah", "tersebut", "secara",
+    "hanya", "lagi", "tapi", "namun", "perlu", "harus", "diberikan", "diberi",
+}
+
+_TOKEN_RE = re.compile(r"[a-z]+")
+
+def tokenize(text) -> list:
+    """Huruf kecil, ambil kata alfabet >= 3 huruf, buang stopword."""
+    if not text: return []
+    return [w[:MAX_TERM_LEN] for w in _TOKEN_RE.findall(str(text).lower())
+            if len(w) >= 3 and w not in STOPWORDS]
+
+def record_note(db, visit_date, old_text, new_text):
+    """Update frekuensi kata hari itu saat catatan berubah (old -> new), sebelum commit."""
+    delta = Counter(tokenize(new_text))
+    delta.subtract(Counter(tokenize(old_text)))
+    for term, n in delta.items():
+        if n:
+            storage.upsert_increment(db, storage.TabelTermHarian,
+                                     {"visit_date": visit_date, "term": term}, {"frequency": n})
+
+def record_notes(db, notes) -> int:
+    """Versi massal record_note untuk catatan baru: notes = [(visit_date, teks), ...]."""
+    counts = Counter()
+    for visit_date, text in notes:
+        for term in tokenize(text):
+            counts[(visit_date, term)] += 1
+    storage.bulk_increment(db, storage.TabelTermHarian,
+                           [({"visit_date": d, "term": w}, {"frequency": n}, None) for (d, w), n in counts.items()])
+    return len(counts)
+
+def top_terms(db, start_date=None, end_date=None, k: int = TOP_K) -> dict:
+    t = storage.TabelTermHarian
+    total = func.sum(t.frequency).label("total")
+    q = db.query(t.term, total)
+    if start_date: q = q.filter(t.visit_date >= start_date)
+    if end_date: q = q.filter(t.visit_date <= end_date)
+    rows = q.group_by(t.term).having(total > 0).order_by(total.desc(), t.term).limit(k).all()
+    return {term: int(n) for term, n in rows}
+
+def rebuild_term_frequencies(db) -> int:
+    """Hitung ulang seluruh frekuensi kata dari catatan medis di TabelPelayanan + arsip."""
+    counts = Counter()
+    for t in storage.VISIT_TABLES:
+        q = db.query(t.visit_date, t.catatan_medis).filter(t.catatan_medis.isnot(None))
+        for visit_date, note in q.yield_per(5000):
+            for term in tokenize(note):
+                counts[(visit_date, term)] += 1
+
+    db.query(storage.TabelTermHarian).delete(synchronize_session=False)
+    if counts:
+        db.execute(insert(storage.TabelTermHarian),
+                   [{"visit_date": d, "term": w, "frequency": n} for (d, w), n in counts.items()])
+    cache.report_cache.bump(db)
+    db.commit()
+    return len(counts)
+
+if __name__ == "__main__":
+    db = storage.SessionLocal()
+    try:
+        print(f"✅ Frekuensi kata dibangun ulang: {rebuild_term_frequencies(db)} baris.")
+    finally:
+        db.close()
@@ -0,0 +1,66 @@
+# FILE: visit_archive.py
+# Pindahkan kunjungan "Selesai" yang sudah lama dari tabel operasional (TabelPelayanan,
+# TabelGabungan) ke tabel arsip, per batch. Endpoint operasional hanya butuh hari ini &
+# tanggal ke depan; riwayat, rebuild analitik & counter membaca tabel panas + arsip.
+#
+#   python visit_archive.py                 # arsipkan kunjungan selesai > 90 hari
+#   python visit_archive.py --days 30 --batch-size 5000
+import argparse
+import time as time_lib
+from datetime import date, timedelta
+
+from sqlalchemy import insert, delete, select, exists
+
+import storage
+
+ARCHIVE_AFTER_DAYS = 90
+BATCH_SIZE = 1000
+
+def _columns(model):
+    return [c.name for c in model.__table__.columns]
+
+def archive_visits(db, older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = BATCH_SIZE, max_batches: int = None) -> int:
+    """Arsipkan kunjungan selesai dengan visit_date < hari ini - older_than_days. Satu commit per batch."""
+    P, G = storage.TabelPelayanan, storage.TabelGabungan
+    PA, GA = storage.TabelPelayananArsip, storage.TabelGabunganArsip
+    O = storage.TabelOutboxGabungan
+    cutoff = date.today() - timedelta(days=older_than_days)
+    p_cols, g_cols = _columns(P), _columns(G)
+
+    moved, batches, t0 = 0, 0, time_lib.perf_counter()
+    while max_batches is None or batches < max_batches:
+        # Tiket yang masih antre di outbox dilewati dulu (TabelGabungan-nya belum final)
+        ids = [i for (i,) in db.query(P.id).filter(
+            P.visit_date < cutoff, P.status_pelayanan == "Selesai",
+            ~exists().where(O.pelayanan_id == P.id),
+        ).order_by(P.id).limit(batch_size)]
+        if not ids: break
+
+        db.execute(insert(PA).from_select(p_cols, select(*[getattr(P, c) for c in p_cols]).where(P.id.in_(ids))))
+        db.execute(insert(GA).from_select(g_cols, select(*[getattr(G, c) for c in g_cols]).where(G.pelayanan_id.in_(ids))))
+        db.execute(delete(G).where(G.pelayanan_id.in_(ids)))
+        db.execute(delete(P).where(P.id.in_(ids)))
+        db.commit()
+
+        moved += len(ids)
+        batches += 1
+        rate = moved / max(time_lib.perf_counter() - t0, 1e-9)
+        print(f"🗄️ Arsip kunjungan: {moved} baris dipindah ({rate:,.0f} baris/detik)")
+    return moved
+
+def visit_count(db, *criteria) -> int:
+    """COUNT kunjungan di tabel panas + arsip (mis. cek sebelum hapus dokter/poli)."""
+    return sum(db.query(t.id).filter(*[c(t) for c in criteria]).count() for t in storage.VISIT_TABLES)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arsipkan kunjungan selesai yang sudah lama.")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Umur minimal kunjungan (hari)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = storage.SessionLocal()
+    try:
+        n = archive_visits(db, args.days, args.batch_size)
+        print(f"✅ {n} kunjungan dipindah ke arsip (lebih lama dari {args.days} hari).")
+    finally:
+        db.close()
@@ -0,0 +1,65 @@
+# FILE: visit_counters.py
+# Counter kunjungan per user di TabelUser (total_visits, completed_visits).
+# Status member ("Pasien Lama" / "Pasien Baru") cukup dibaca dari baris user (primary key),
+# tanpa COUNT(*) atas seluruh riwayat TabelPelayanan. Counter di-update di transaksi
+# yang sama dengan tiket (pendaftaran, scan selesai, import); recount memperbaiki drift.
+#
+#   python visit_counters.py   # hitung ulang semua counter dari TabelPelayanan (+ arsip)
+from sqlalchemy import update, bindparam, select, func
+
+import storage
+
+def member_status(visit_count: int) -> str:
+    return "Pasien Lama" if (visit_count or 0) > 0 else "Pasien Baru"
+
+def _apply(db, deltas: dict):
+    """deltas: username -> (tambah_total, tambah_selesai). Satu UPDATE executemany."""
+    if not deltas: return
+    u = storage.TabelUser.__table__
+    stmt = update(u).where(u.c.username == bindparam("u")).values(
+        total_visits=u.c.total_visits + bindparam("t"),
+        completed_visits=u.c.completed_visits + bindparam("c"),
+    )
+    db.execute(stmt, [{"u": name, "t": t, "c": c} for name, (t, c) in deltas.items()])
+
+def add_visits(db, tickets):
+    """Tiket baru (objek dengan username & status_pelayanan); status 'Selesai' ikut dihitung selesai."""
+    deltas = {}
+    for t in tickets:
+        if not t.username: continue
+        total, done = deltas.get(t.username, (0, 0))
+        deltas[t.username] = (total + 1, done + (t.status_pelayanan == "Selesai"))
+    _apply(db, deltas)
+
+def add_completed(db, username: str):
+    """Tiket user ini baru saja berpindah ke 'Selesai'."""
+    if username: _apply(db, {username: (0, 1)})
+
+def recount(db) -> list:
+    """Hitung ulang counter dari TabelPelayanan + arsip. Hanya user yang counternya meleset
+    yang di-update (selisihnya ditambahkan, aman terhadap tiket yang masuk bersamaan).
+    Return daftar drift: {username, total_visits, completed_visits, expected_total, expected_completed}."""
+    u = storage.TabelUser.__table__
+    total, done = 0, 0
+    for p in (m.__table__ for m in storage.VISIT_TABLES):
+        total = total + select(func.count(p.c.id)).where(p.c.username == u.c.username).scalar_subquery()
+        done = done + select(func.count(p.c.id)).where(p.c.username == u.c.username, p.c.status_pelayanan == "Selesai").scalar_subquery()
+    rows = db.execute(
+        select(u.c.username, u.c.total_visits, u.c.completed_visits, total.label("expected_total"), done.label("expected_completed"))
+        .where((u.c.total_visits != total) | (u.c.completed_visits != done))
+    ).all()
+    _apply(db, {r.username: (r.expected_total - r.total_visits, r.expected_completed - r.completed_visits) for r in rows})
+    db.commit()
+    return [r._asdict() for r in rows]
+
+if __name__ == "__main__":
+    db = storage.SessionLocal()
+    try:
+        drift = recount(db)
+        for d in drift[:50]:
+            print(f"⚠️ {d['username']}: total {d['total_visits']} -> {d['expected_total']}, "
+                  f"selesai {d['completed_visits']} -> {d['expected_completed']}")
+        if len(drift) > 50: print(f"... dan {len(drift) - 50} user lain")
+        print(f"✅ Counter kunjungan dihitung ulang: {len(drift)} user diperbaiki.")
+    finally:
+        db.close()